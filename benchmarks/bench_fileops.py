@@ -0,0 +1,136 @@
+"""Throughput of std/fileOps: the copying readers against mmap and string_view lines,
+and appnd_to_file in a loop against a persistent appender.
+
+Needs g++ and free disk space for the test file. Usage:
+python benchmarks/bench_fileops.py [gigabytes] [appended lines]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import load_pypp, quiet
+
+# the std/fileOps readers before the mmap-based ones, for comparison
+OLD_FILEOPS = """
+#include <algorithm>
+#include <fstream>
+#include <vector>
+
+fn read_file(const std::string &path) strT
+    std::ifstream f(path)
+    return {std::istreambuf_iterator<char>(f), std::istreambuf_iterator<char>()};
+end
+
+fn read_lines(const std::string &path) strvec
+    std::ifstream f(path)
+    strvec lines
+    std::string line
+    while std::getline(f, line)
+        line.erase(std::remove(line.begin(), line.end(), '\\r'), line.end())
+        lines.push_back(line)
+    end
+    return lines
+end
+"""
+
+
+def make_program(data: str, out: str, appends: int) -> str:
+    return f"""
+imp std/fileOps.pypp
+imp std/time.pypp
+imp old_fileops.pypp
+
+fn report(const char* name, double bytes, double seconds)
+    print(name, ": ", seconds, "s, ", (long long)(bytes / seconds / 1e6), " MB/s\\n")
+end
+
+fn main() int
+    std::string data = "{data}"
+    double bytes = (double)fileOps_map_file(data).size()
+    std::size_t acc = 0
+
+    double start = time_now_()
+    acc += old_fileops_read_file(data).size()
+    report("old read_file ", bytes, time_since(start))
+
+    start = time_now_()
+    acc += fileOps_read_file(data).size()
+    report("read_file     ", bytes, time_since(start))
+
+    start = time_now_()
+    acc += old_fileops_read_lines(data).size()
+    report("old read_lines", bytes, time_since(start))
+
+    start = time_now_()
+    acc += fileOps_read_lines(data).size()
+    report("read_lines    ", bytes, time_since(start))
+
+    start = time_now_()
+    foreach line fileOps_each_line(data)
+        acc += line.size()
+    end
+    report("each_line     ", bytes, time_since(start))
+
+    long long n = {appends}
+    start = time_now_()
+    for (long long i = 0; i < n; i++) fileOps_appnd_to_file("{out}", "some line of output\\n");
+    report("appnd_to_file ", n * 20.0, time_since(start))
+
+    start = time_now_()
+    fileOps_writer appender = fileOps_open_appender("{out}")
+    for (long long i = 0; i < n * 100; i++) appender.write("some line of output\\n");
+    appender.close()
+    report("open_appender ", n * 2000.0, time_since(start))
+
+    print("(checksum ", acc, ")\\n")
+    return 0
+end
+"""
+
+
+def write_data(path: str, size: int):
+    line = b"".join(b"%d,some text in a csv-ish row,%d.5\n" % (i, i * 7) for i in range(10_000))
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            f.write(line)
+            written += len(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="std/fileOps throughput benchmark (needs g++).")
+    parser.add_argument("gigabytes", nargs="?", type=float, default=1, help="size of the test file")
+    parser.add_argument("appends", nargs="?", type=int, default=20_000, help="lines to append")
+    options = parser.parse_args()
+    size, appends = int(options.gigabytes * 1e9), options.appends
+
+    pypp = load_pypp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # a throwaway install, so `imp std/...` finds the current built-in modules
+        pypp.install_dir = lambda: tmp
+        for rel, content in pypp.BUILTIN_MODULES.items():
+            path = os.path.join(tmp, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        with open(os.path.join(tmp, "old_fileops.pypp"), "w", encoding="utf-8") as f:
+            f.write(OLD_FILEOPS)
+        data = os.path.join(tmp, "data.csv")
+        write_data(data, size)
+        main_path = os.path.join(tmp, "main.pypp")
+        with open(main_path, "w", encoding="utf-8") as f:
+            f.write(make_program(data, os.path.join(tmp, "appended.txt"), appends))
+
+        with quiet():
+            ok = pypp.build(main_path, [main_path], cpp_path=os.path.join(tmp, "out.cpp"))
+        if not ok:
+            sys.exit("build failed")
+        subprocess.run([main_path[:-5]], check=True)
+
+
+if __name__ == "__main__":
+    main()
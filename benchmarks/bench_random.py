@@ -0,0 +1,116 @@
+"""Numbers per second of std/random against the clock-derived generator it replaced.
+
+Needs g++. Usage: python benchmarks/bench_random.py [millions]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import load_pypp, quiet
+
+# std/random before the xoshiro256** engine, for comparison
+OLD_RANDOM = """
+#include <cmath>
+imp std/time.pypp
+
+
+fn rand01() double
+    double __seed = fmod(time_now_() * 6364136223846793005.0 * time_since(1) + 1.0, 1e9)
+    return fmod(__seed / 1e9, 1.0)
+end
+
+fn randint(int a, int b) int
+    return a + (int)(rand01() * (b - a + 1))
+end
+
+fn uniform(double a, double b) double
+    return a + rand01() * (b - a)
+end
+
+fn randlen(int length) int
+    if length <= 0
+        return 0
+    end
+    int num = randint(1, 9); 
+    for (int i = 1; i < length; i++) {
+        int digit = randint(0, 9);
+        num = num * 10 + digit;
+    }
+    return num
+end
+"""
+
+
+def make_program(n: int) -> str:
+    return f"""
+imp std/random.pypp
+imp old_random.pypp
+
+fn report(const char* name, long long n, double seconds)
+    print(name, ": ", (long long)(n / seconds), " numbers/s\\n")
+end
+
+fn main() int
+    long long n = {n}
+    long long acc = 0
+    random_seed(1)
+
+    double start = time_now_()
+    for (long long i = 0; i < n / 50; i++) acc += old_random_randint(0, 99);
+    report("old randint ", n / 50, time_since(start))
+
+    start = time_now_()
+    for (long long i = 0; i < n; i++) acc += random_randint(0, 99);
+    report("randint     ", n, time_since(start))
+
+    start = time_now_()
+    for (long long i = 0; i < n; i++) acc += (long long)(random_rand01() * 100);
+    report("rand01      ", n, time_since(start))
+
+    vec<int> block(1 << 16);
+    start = time_now_()
+    for (long long done = 0; done < n; done += block.size()) {{
+        random_fill_randint(block, 0, 99)
+        acc += block[0]
+    }}
+    report("fill_randint", n, time_since(start))
+
+    print("(checksum ", acc, ")\\n")
+    return 0
+end
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="std/random throughput benchmark (needs g++).")
+    parser.add_argument("millions", nargs="?", type=float, default=100, help="numbers to draw")
+    n = int(parser.parse_args().millions * 1e6)
+
+    pypp = load_pypp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # a throwaway install, so `imp std/...` finds the current built-in modules
+        pypp.install_dir = lambda: tmp
+        for rel, content in pypp.BUILTIN_MODULES.items():
+            path = os.path.join(tmp, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        with open(os.path.join(tmp, "old_random.pypp"), "w", encoding="utf-8") as f:
+            f.write(OLD_RANDOM)
+        main_path = os.path.join(tmp, "main.pypp")
+        with open(main_path, "w", encoding="utf-8") as f:
+            f.write(make_program(n))
+
+        with quiet():
+            ok = pypp.build(main_path, [main_path], cpp_path=os.path.join(tmp, "out.cpp"))
+        if not ok:
+            sys.exit("build failed")
+        subprocess.run([main_path[:-5]], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Scaling benchmark for the import renamer (load_with_imports_renamed).
+
+Usage: python benchmarks/bench_rename.py [max_funcs]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from common import load_pypp, quiet
+
+
+def make_module(n_funcs: int) -> str:
+    out = []
+    for i in range(n_funcs):
+        out.append(f"int counter_{i} = {i}")
+    for i in range(n_funcs):
+        callee = f"func_{i - 1}(x) + " if i else ""
+        out.append(f"fn func_{i}(int x) int")
+        out.append(f'    print("func_{i} ", x, "\\n")')
+        out.append(f"    return {callee}counter_{i} + x")
+        out.append("end")
+    return "\n".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import renamer scaling benchmark.")
+    parser.add_argument("max_funcs", nargs="?", type=int, default=1600, help="largest module size")
+    max_funcs = parser.parse_args().max_funcs
+
+    pypp = load_pypp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        main_path = os.path.join(tmp, "main.pypp")
+        with open(main_path, "w", encoding="utf-8") as f:
+            f.write("imp big.pypp\n")
+
+        print(f"{'funcs':>8} {'lines':>8} {'seconds':>10} {'us/line':>10}")
+        n = 50
+        while n <= max_funcs:
+            src = make_module(n)
+            with open(os.path.join(tmp, "big.pypp"), "w", encoding="utf-8") as f:
+                f.write(src)
+
+            with quiet():
+                start = time.perf_counter()
+                pypp.load_with_imports_renamed(main_path)
+                took = time.perf_counter() - start
+
+            n_lines = src.count("\n") + 1
+            print(f"{n:>8} {n_lines:>8} {took:>10.4f} {took / n_lines * 1e6:>10.2f}")
+            n *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Scaling benchmark for the transpiler on generated multi-module projects.
+
+A synthetic project (modules importing each other in chains, each with
+globals, defines, ranges and nested blocks) is loaded and transpiled as
+`build` would, without running g++. Every phase that --time-phases reports
+is timed on its own; of `--repeats` runs the fastest is kept. One size
+parameter is multiplied by each of `--steps` to get a scaling curve.
+
+Results can be appended to a JSON lines file with `--json`, and compared
+against an earlier file with `--compare`: rows with the same parameters are
+matched, and any phase more than `--tolerance` slower is reported (and the
+exit status is 1).
+
+Usage: python benchmarks/bench_scaling.py [--modules N] [--funcs N]
+           [--globals N] [--defines N] [--ranges N] [--depth N]
+           [--import-depth N] [--vary NAME] [--steps 1,2,4,8]
+           [--repeats N] [--json FILE] [--compare FILE] [--tolerance F]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import load_pypp, quiet
+
+SIZES = {
+    "modules": (8, "modules besides main"),
+    "funcs": (40, "functions per module"),
+    "globals": (20, "global variables per module"),
+    "defines": (10, "defines per module, half of them with parameters"),
+    "ranges": (4, "range literals per function"),
+    "depth": (3, "nesting depth of the blocks in each function"),
+    "import_depth": (4, "length of each chain of imports below main"),
+}
+NESTED = ["if n > {i}", "foreach y{i} 0..{i}:1", "while acc > {i}", "repeat {i}"]
+
+
+def make_module(index: int, calls: str, sizes: dict) -> str:
+    """Source of module `m<index>`; its functions call `calls` (a module name) if set."""
+    name = f"m{index}"
+    out = [f"imp {calls}.pypp", ""] if calls else []
+    for j in range(sizes["defines"]):
+        if j % 2:
+            out.append(f"define {name}_twice_{j}(x) ((x) * 2 + {j})")
+        else:
+            out.append(f"define {name}_limit_{j} {j + 10}")
+    for g in range(sizes["globals"]):
+        out.append(f"int total_{g} = {g}")
+    out.append("")
+
+    for i in range(sizes["funcs"]):
+        out.append(f"fn f_{i}(int n) int")
+        start = f"total_{i % sizes['globals']}" if sizes["globals"] else "0"
+        out.append(f"    int acc = {start}")
+        for j in range(sizes["defines"]):
+            use = f"{name}_twice_{j}(n)" if j % 2 else f"{name}_limit_{j}"
+            out.append(f"    acc += {use}")
+        for r in range(sizes["ranges"]):
+            if r % 2:
+                out.append(f"    vec<int> r{r} = (x * 2 foreach x 1..{r + 4} if x > 1)")
+                out.append(f"    acc += r{r}.size()")
+            else:
+                out.append(f"    foreach x{r} 0..{r + 8}:2")
+                out.append(f"        acc += x{r}")
+                out.append("    end")
+        indent = "    "
+        for d in range(sizes["depth"]):
+            out.append(indent + NESTED[d % len(NESTED)].format(i=d + 1))
+            indent += "    "
+            out.append(f"{indent}acc -= 1")
+        for d in range(sizes["depth"]):
+            indent = indent[:-4]
+            out.append(indent + "end")
+        out.append(f'    print("{name}.f_{i} ", acc, "\\n")')
+        callee = f" + {calls}_f_{i}(n - 1)" if calls else ""
+        out.append(f"    return acc{callee}")
+        out.append("end")
+        out.append("")
+    return "\n".join(out)
+
+
+def write_project(root: str, sizes: dict) -> tuple:
+    """Write main.pypp and its modules to `root`; returns (main path, source lines)."""
+    n_lines = 0
+    heads = []
+    chain = max(1, sizes["import_depth"])
+    for index in range(sizes["modules"]):
+        # modules form chains of `chain` imports, main imports the first of each
+        last = index % chain == chain - 1 or index == sizes["modules"] - 1
+        src = make_module(index, None if last else f"m{index + 1}", sizes)
+        if index % chain == 0:
+            heads.append(f"m{index}")
+        with open(os.path.join(root, f"m{index}.pypp"), "w", encoding="utf-8") as f:
+            f.write(src)
+        n_lines += src.count("\n") + 1
+
+    main = [f"imp {head}.pypp" for head in heads] + ["", "fn main() int", "    int n = 3"]
+    if sizes["funcs"]:
+        main += [f"    n += {head}_f_0(n)" for head in heads]
+    main += ["    return n > 0 ? 0 : 1", "end"]
+    path = os.path.join(root, "main.pypp")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(main))
+    return path, n_lines + len(main)
+
+
+def measure(pypp, main_path: str) -> dict:
+    """One load and transpile of `main_path`, timed per phase."""
+    pypp.PHASE_STATS = stats = pypp.PhaseStats()
+    try:
+        with quiet():
+            start = time.perf_counter()
+            src = pypp.load_with_imports_renamed(main_path)
+            with pypp.phase("transpile"):
+                out_cpp = pypp.transpile_paren_blocks_to_cpp(src)
+            seconds = time.perf_counter() - start
+    finally:
+        pypp.PHASE_STATS = None
+    return {
+        "seconds": seconds,
+        "phases": {name: entry["seconds"] for name, entry in stats.phases.items()},
+        "lines": {"loaded": src.count("\n") + 1, "generated": out_cpp.count("\n") + 1},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(rows: list, baseline_path: str, tolerance: float) -> int:
+    """Print the phases of `rows` that got slower than in `baseline_path`; returns their count."""
+    baseline = {}
+    commits = set()
+    with open(baseline_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                baseline[json.dumps(row["sizes"], sort_keys=True)] = row  # the latest run wins
+                commits.add(row.get("commit") or "?")
+
+    slower = 0
+    print(f"\ncompared with {baseline_path} (commit {', '.join(sorted(commits))}):")
+    for row in rows:
+        old = baseline.get(json.dumps(row["sizes"], sort_keys=True))
+        if old is None:
+            print(f"  {row['source_lines']:>8} lines: no matching run")
+            continue
+        pairs = [("total", old["seconds"], row["seconds"])]
+        pairs += [
+            (name, old["phases"].get(name, 0.0), seconds)
+            for name, seconds in row["phases"].items()
+        ]
+        for name, before, after in pairs:
+            if before <= 0:
+                continue
+            ratio = after / before
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  SLOWER"
+                slower += 1
+            print(
+                f"  {row['source_lines']:>8} lines  {name:<20}{before:9.4f}s -> {after:9.4f}s"
+                f"  x{ratio:5.2f}{flag}"
+            )
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transpiler scaling benchmark (no g++ needed).")
+    for name, (default, help_text) in SIZES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default, help=help_text)
+    parser.add_argument("--vary", choices=sorted(SIZES), default="funcs", help="size to scale")
+    parser.add_argument("--steps", default="1,2,4,8", help="multipliers of the varied size")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per size; the fastest is kept")
+    parser.add_argument("--json", help="append one JSON line per size to this file")
+    parser.add_argument("--compare", help="JSON lines file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown (0.10 = 10%%)")
+    options = parser.parse_args()
+
+    pypp = load_pypp()
+    base = {name: getattr(options, name) for name in SIZES}
+    steps = [int(step) for step in options.steps.split(",")]
+    rows = []
+
+    phase_names = ["load", "preprocess_defines", "expand_ranges", "transpile"]
+    print(f"varying {options.vary}; " + ", ".join(f"{k}={v}" for k, v in base.items()))
+    print(
+        f"{options.vary:>12} {'lines':>8} {'seconds':>9} {'us/line':>8} "
+        + " ".join(f"{name:>18}" for name in phase_names)
+    )
+    for step in steps:
+        sizes = dict(base, **{options.vary: base[options.vary] * step})
+        with tempfile.TemporaryDirectory() as tmp:
+            main_path, n_lines = write_project(tmp, sizes)
+            best = min((measure(pypp, main_path) for _ in range(options.repeats)),
+                       key=lambda result: result["seconds"])
+        row = {
+            "bench": "scaling",
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "sizes": sizes,
+            "source_lines": n_lines,
+            **best,
+        }
+        rows.append(row)
+        print(
+            f"{sizes[options.vary]:>12} {n_lines:>8} {best['seconds']:>9.4f} "
+            f"{best['seconds'] / n_lines * 1e6:>8.2f} "
+            + " ".join(f"{best['phases'].get(name, 0.0):>17.4f}s" for name in phase_names)
+        )
+
+    if options.json:
+        with open(options.json, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+    if options.compare and compare(rows, options.compare, options.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Time per call of std/strOps against the copying functions it had before.
+
+Needs g++. Usage: python benchmarks/bench_strops.py [thousands of lines]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import load_pypp, quiet
+
+# std/strOps before the view-based functions, for comparison
+OLD_STROPS = """
+#include <algorithm>
+#include <cctype>
+#include <string>
+
+fn trim(const std::string& s) strT
+    size_t start = 0
+    while start < s.size() && std::isspace(s[start])
+        start++
+    end
+    size_t end = s.size()
+    while end > start && std::isspace(s[end - 1])
+        end--
+    end
+    return s.substr(start, end - start)
+end
+
+fn lower(std::string s) strT
+    std::transform(s.begin(), s.end(), s.begin(), [](unsigned char c){ return std::tolower(c); });
+    return s
+end
+
+fn split(const std::string& s, char delimiter) strvec
+    strvec result;
+    size_t start = 0, end;
+    while (end = s.find(delimiter, start)) != std::string::npos
+        result.push_back(s.substr(start, end - start));
+        start = end + 1;
+    end
+    result.push_back(s.substr(start));
+    return result
+end
+
+fn join(const strvec& s, char delimiter) strT
+    std::string result;
+    for (size_t i = 0; i < s.size(); i++) {
+        result += s[i];
+        if (i < s.size() - 1)
+            result += delimiter;
+        end
+    }
+    return result
+end
+"""
+
+
+def make_program(n: int) -> str:
+    return f"""
+imp std/strOps.pypp
+imp std/time.pypp
+imp old_strops.pypp
+
+fn report(const char* name, long long calls, double seconds)
+    print(name, ": ", (long long)(seconds / calls * 1e9), " ns/line\\n")
+end
+
+fn main() int
+    long long n = {n}
+    strvec lines
+    for (long long i = 0; i < n; i++) lines.push_back("  " + std::to_string(i) + ",Some Mixed Case Text," + std::to_string(i * 31) + ",Another Field,X  ");
+    std::size_t acc = 0
+
+    double start = time_now_()
+    for (const auto& l : lines) acc += old_strops_split(l, ',').size();
+    report("old split     ", n, time_since(start))
+
+    start = time_now_()
+    for (const auto& l : lines) acc += strOps_split(l, ',').size();
+    report("split         ", n, time_since(start))
+
+    start = time_now_()
+    for (const auto& l : lines) acc += strOps_split_view(l, ',').size();
+    report("split_view    ", n, time_since(start))
+
+    start = time_now_()
+    for (const auto& l : lines) for (std::string_view f : strOps_each_split(l, ",")) acc += f.size();
+    report("each_split    ", n, time_since(start))
+
+    strvec fields = old_strops_split(lines[0], ',')
+    start = time_now_()
+    for (long long i = 0; i < n; i++) acc += old_strops_join(fields, ';').size();
+    report("old join      ", n, time_since(start))
+
+    start = time_now_()
+    for (long long i = 0; i < n; i++) acc += strOps_join(fields, ';').size();
+    report("join          ", n, time_since(start))
+
+    start = time_now_()
+    for (const auto& l : lines) acc += old_strops_trim(l).size();
+    report("old trim      ", n, time_since(start))
+
+    start = time_now_()
+    for (const auto& l : lines) acc += strOps_trim_view(l).size();
+    report("trim_view     ", n, time_since(start))
+
+    start = time_now_()
+    for (const auto& l : lines) acc += old_strops_lower(l)[3];
+    report("old lower     ", n, time_since(start))
+
+    start = time_now_()
+    for (auto& l : lines) {{
+        strOps_lower_inplace(l)
+        acc += l[3]
+    }}
+    report("lower_inplace ", n, time_since(start))
+
+    print("(checksum ", acc, ")\\n")
+    return 0
+end
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="std/strOps time per call benchmark (needs g++).")
+    parser.add_argument("thousands", nargs="?", type=float, default=1000, help="lines of input")
+    n = int(parser.parse_args().thousands * 1e3)
+
+    pypp = load_pypp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # a throwaway install, so `imp std/...` finds the current built-in modules
+        pypp.install_dir = lambda: tmp
+        for rel, content in pypp.BUILTIN_MODULES.items():
+            path = os.path.join(tmp, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        with open(os.path.join(tmp, "old_strops.pypp"), "w", encoding="utf-8") as f:
+            f.write(OLD_STROPS)
+        main_path = os.path.join(tmp, "main.pypp")
+        with open(main_path, "w", encoding="utf-8") as f:
+            f.write(make_program(n))
+
+        with quiet():
+            ok = pypp.build(main_path, [main_path], cpp_path=os.path.join(tmp, "out.cpp"))
+        if not ok:
+            sys.exit("build failed")
+        subprocess.run([main_path[:-5]], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Line throughput of transpile_paren_blocks_to_cpp on a generated program.
+
+Usage: python benchmarks/bench_transpile.py [n_funcs] [repeats]
+"""
+
+import argparse
+import time
+
+from common import load_pypp, quiet
+
+
+def make_program(n_funcs: int) -> str:
+    out = []
+    for i in range(n_funcs):
+        out += [
+            f"fn work_{i}(int n, strvec names) int",
+            "    %> generated body",
+            "    int total = 0",
+            "    vec<int> doubled = (x * 2 foreach x 0..10)",
+            "    foreach name names",
+            '        print("name: ", name, "\\n")',
+            "    end",
+            "    repeat n",
+            "        total += 1",
+            "    end",
+            "    while total > 100",
+            "        total -= 3",
+            "    end",
+            "    if total > 10",
+            "        total += 1",
+            "    elif total > 5",
+            "        total += 2",
+            "    else",
+            "        total += 3",
+            "    end",
+            "    int a = 1 § int b = 2",
+            "    lam: add(int p, int q) => p + q",
+            "    assert: total >= 0 @@@ \"negative\"",
+            "    try",
+            "        total += std::stoi(\"4\")",
+            "    catch ...",
+            "        total = -1",
+            "    end",
+            "    return total + add(a, b)",
+            "end",
+        ]
+    out += [
+        "fn main() int",
+        "    int n",
+        '    numinput("n: ", n)',
+        "    return work_0(n, {})",
+        "end",
+    ]
+    return "\n".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transpiler line throughput benchmark.")
+    parser.add_argument("n_funcs", nargs="?", type=int, default=2000, help="functions in the program")
+    parser.add_argument("repeats", nargs="?", type=int, default=3, help="runs; the fastest is kept")
+    options = parser.parse_args()
+    n_funcs, repeats = options.n_funcs, options.repeats
+
+    pypp = load_pypp()
+
+    src = make_program(n_funcs)
+    n_lines = src.count("\n") + 1
+
+    best = float("inf")
+    for _ in range(repeats):
+        with quiet():
+            start = time.perf_counter()
+            pypp.transpile_paren_blocks_to_cpp(src)
+            best = min(best, time.perf_counter() - start)
+
+    print(f"{n_lines} lines in {best:.3f}s: {n_lines / best:,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Helpers shared by the benchmark scripts."""
+
+import contextlib
+import importlib.util
+import os
+import sys
+
+
+def load_pypp():
+    """Import py++.py as a module (its file name is not a valid identifier)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "py++.py")
+    spec = importlib.util.spec_from_file_location("pypp", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the transpiler's progress output while timing."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
@@ -1,10 +1,28 @@
 import os
+import posixpath
 import re
 import sys
 import subprocess
 import shutil
 import uuid
-from typing import List, Set, Optional
+import hashlib
+import json
+import multiprocessing
+import glob
+import io
+import time
+import tempfile
+import tracemalloc
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import count, islice
+from typing import Any, Callable, Collection, Dict, Iterable, Iterator, List, Set, Optional, TextIO, Tuple
+
+# macro name -> (parameter names, replacement text)
+Defines = Dict[str, Tuple[List[str], str]]
+# (directory of the importing file, `imp` target) -> the file it resolved to
+Imports = Dict[Tuple[str, str], str]
 
 
 def add_to_path_win(target_dir: str):
@@ -18,17 +36,41 @@ def add_to_path_win(target_dir: str):
     )
 
 
-def setup_install(target_dir: str):
-    os.makedirs(os.path.join(target_dir, "modules"), exist_ok=True)
-
-    builtins = {
-        "modules/std/fileOps.pypp": """
+# sources of the built-in modules, written to <install dir>/modules by setup_install
+BUILTIN_MODULES: Dict[str, str] = {
+    "modules/std/fileOps.pypp": """
+#include <algorithm>
+#include <cstdio>
+#include <cstring>
 #include <fstream>
+#include <string>
+#include <string_view>
+#include <utility>
 #include <vector>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
 
 fn read_file(const std::string &path) strT
     std::ifstream f(path)
-    return {std::istreambuf_iterator<char>(f), std::istreambuf_iterator<char>()};
+    f.seekg(0, std::ios::end)
+    std::streamoff length = f.tellg()
+    f.clear()
+    f.seekg(0)
+    %> pipes and /proc files do not report a size
+    if length <= 0
+        return {std::istreambuf_iterator<char>(f), std::istreambuf_iterator<char>()};
+    end
+    std::string content((std::size_t)length, '\\0');
+    f.read(&content[0], length)
+    %> text mode may hand back fewer characters than the file has bytes
+    content.resize((std::size_t)f.gcount())
+    return content
 end
 
 fn write_file(const std::string &path, const std::string &content)
@@ -36,32 +78,233 @@ fn write_file(const std::string &path, const std::string &content)
     f << content
 end
 
-fn read_lines(const std::string &path) strvec
-    std::ifstream f(path)
-    if !f.is_open()
-        print("Failed to open file: ", path, "\\n")
-        return {};
+fn exists(const std::string &path) bool
+    return std::ifstream(path).good()
+end
+
+%> A whole file mapped read-only into memory. Move-only, unmapped when it goes
+%> out of scope; ok() is false if the file could not be opened or mapped.
+struct fileOps_mapped {
+    const char* ptr{nullptr};
+    std::size_t len{0};
+    bool opened{false};
+
+    fileOps_mapped() = default;
+    fileOps_mapped(const fileOps_mapped&) = delete;
+    fileOps_mapped& operator=(const fileOps_mapped&) = delete;
+    fileOps_mapped(fileOps_mapped&& o) noexcept { swap(o); }
+    fileOps_mapped& operator=(fileOps_mapped&& o) noexcept { swap(o); return *this; }
+    ~fileOps_mapped() { unmap(); }
+
+    void swap(fileOps_mapped& o) noexcept { std::swap(ptr, o.ptr); std::swap(len, o.len); std::swap(opened, o.opened); }
+#ifdef _WIN32
+    void unmap() { if (ptr) UnmapViewOfFile(ptr); ptr = nullptr; len = 0; }
+#else
+    void unmap() { if (ptr) munmap((void*)ptr, len); ptr = nullptr; len = 0; }
+#endif
+
+    bool ok() const { return opened; }
+    const char* data() const { return ptr; }
+    std::size_t size() const { return len; }
+    std::string_view view() const { return std::string_view(ptr, len); }
+    operator std::string_view() const { return view(); }
+};
+
+fn map_file(const std::string &path) fileOps_mapped
+    fileOps_mapped m
+#ifdef _WIN32
+    HANDLE file = CreateFileA(path.c_str(), GENERIC_READ, FILE_SHARE_READ, nullptr, OPEN_EXISTING, FILE_FLAG_SEQUENTIAL_SCAN, nullptr)
+    if file == INVALID_HANDLE_VALUE
+        return m
     end
+    LARGE_INTEGER bytes
+    if GetFileSizeEx(file, &bytes)
+        %> an empty file cannot be mapped, but it opened fine
+        m.opened = bytes.QuadPart == 0
+        HANDLE mapping = bytes.QuadPart ? CreateFileMappingA(file, nullptr, PAGE_READONLY, 0, 0, nullptr) : nullptr
+        if mapping
+            m.ptr = (const char*)MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0)
+            m.len = m.ptr ? (std::size_t)bytes.QuadPart : 0
+            m.opened = m.ptr != nullptr
+            CloseHandle(mapping)
+        end
+    end
+    CloseHandle(file)
+#else
+    int fd = ::open(path.c_str(), O_RDONLY)
+    if fd < 0
+        return m
+    end
+    struct stat st;
+    if fstat(fd, &st) == 0
+        %> an empty file cannot be mapped, but it opened fine
+        m.opened = st.st_size == 0
+        void* p = st.st_size ? mmap(nullptr, (std::size_t)st.st_size, PROT_READ, MAP_PRIVATE, fd, 0) : MAP_FAILED
+        if p != MAP_FAILED
+            madvise(p, (std::size_t)st.st_size, MADV_SEQUENTIAL)
+            m.ptr = (const char*)p
+            m.len = (std::size_t)st.st_size
+            m.opened = true
+        end
+    end
+    ::close(fd)
+#endif
+    return m
+end
 
-    strvec lines
-    std::string line
-    while std::getline(f, line)
-        line.erase(std::remove(line.begin(), line.end(), '\\r'), line.end())
-        lines.push_back(line)
+%> Walks a text line by line. Each line is a string_view into the text, with
+%> the newline and a trailing CR cut off, so nothing is copied.
+struct fileOps_line_iterator {
+    const char* pos{nullptr};
+    const char* stop{nullptr};
+    std::string_view cur;
+
+    fileOps_line_iterator() = default;
+    fileOps_line_iterator(const char* first, const char* last) : pos(first), stop(last) { advance(); }
+
+    const std::string_view& operator*() const { return cur; }
+    bool operator!=(const fileOps_line_iterator& o) const { return pos != o.pos; }
+    fileOps_line_iterator& operator++() { advance(); return *this; }
+
+    void advance() {
+        %> the end iterator has pos == nullptr
+        if pos == stop
+            pos = nullptr
+            return
+        end
+        const char* nl = (const char*)std::memchr(pos, '\\n', stop - pos)
+        const char* line_end = nl ? nl : stop
+        if line_end != pos && line_end[-1] == '\\r'
+            cur = std::string_view(pos, line_end - pos - 1)
+        else
+            cur = std::string_view(pos, line_end - pos)
+        end
+        pos = nl ? nl + 1 : stop
+    }
+};
+
+%> The lines of a text, for use with foreach. Keeps the mapping alive when it
+%> was made by each_line.
+struct fileOps_lines {
+    fileOps_mapped source;
+    std::string_view text;
+
+    fileOps_line_iterator begin() const { return fileOps_line_iterator(text.data(), text.data() + text.size()); }
+    fileOps_line_iterator end() const { return fileOps_line_iterator(); }
+};
+
+fn lines_of(std::string_view text) fileOps_lines
+    fileOps_lines lines
+    lines.text = text
+    return lines
+end
+
+fn each_line(const std::string &path) fileOps_lines
+    fileOps_lines lines
+    lines.source = map_file(path)
+    if !lines.source.ok()
+        print("Failed to open file: ", path, "\\n")
     end
+    lines.text = lines.source.view()
     return lines
 end
 
+fn read_lines(const std::string &path) strvec
+    fileOps_mapped file = map_file(path)
+    std::string unmapped
+    if file.size() == 0
+        if !exists(path)
+            print("Failed to open file: ", path, "\\n")
+            return {};
+        end
+        %> empty, or a pipe or /proc file that cannot be mapped
+        unmapped = read_file(path)
+    end
+    std::string_view text = file.size() ? file.view() : std::string_view(unmapped);
+
+    strvec result
+    result.reserve(std::count(text.begin(), text.end(), '\\n') + 1)
+    for (std::string_view line : lines_of(text)) result.emplace_back(line);
+    return result
+end
+
+%> A file kept open for writing. Writes collect in a 64K buffer that goes out
+%> in one call when full, on flush() and on close() or destruction.
+struct fileOps_writer {
+    static constexpr std::size_t capacity = 1 << 16;
+    std::FILE* file{nullptr};
+    std::string pending;
+
+    fileOps_writer() = default;
+    fileOps_writer(const fileOps_writer&) = delete;
+    fileOps_writer& operator=(const fileOps_writer&) = delete;
+    fileOps_writer(fileOps_writer&& o) noexcept : file(std::exchange(o.file, nullptr)), pending(std::move(o.pending)) {}
+    fileOps_writer& operator=(fileOps_writer&& o) noexcept { std::swap(file, o.file); std::swap(pending, o.pending); return *this; }
+    ~fileOps_writer() { close(); }
+
+    bool ok() const { return file != nullptr; }
+
+    void write(std::string_view s) {
+        if pending.size() + s.size() > capacity
+            flush()
+            %> too big to be worth buffering
+            if s.size() >= capacity && file
+                std::fwrite(s.data(), 1, s.size(), file)
+                return
+            end
+        end
+        pending.append(s.data(), s.size())
+    }
+
+    void writeln(std::string_view s) {
+        write(s)
+        write("\\n")
+    }
+
+    void flush() {
+        if file && !pending.empty()
+            std::fwrite(pending.data(), 1, pending.size(), file)
+        end
+        pending.clear()
+    }
+
+    void close() {
+        flush()
+        if file
+            std::fclose(file)
+            file = nullptr
+        end
+    }
+};
+
+fn open_file(const std::string &path, const char* mode) fileOps_writer
+    fileOps_writer w
+    w.file = std::fopen(path.c_str(), mode)
+    if w.file
+        %> the writer does its own buffering
+        std::setvbuf(w.file, nullptr, _IONBF, 0)
+        w.pending.reserve(fileOps_writer::capacity)
+    else
+        print("Failed to open file: ", path, "\\n")
+    end
+    return w
+end
+
+fn open_writer(const std::string &path) fileOps_writer
+    return open_file(path, "w")
+end
+
+fn open_appender(const std::string &path) fileOps_writer
+    return open_file(path, "a")
+end
+
 fn appnd_to_file(const std::string &path, const std::string &content) 
     std::ofstream f(path, std::ios::app)
     f << content
 end
 
-fn exists(const std::string &path) bool
-    return std::ifstream(path).good()
-end
 """,
-        "modules/std/time.pypp": """
+    "modules/std/time.pypp": """
 #include <chrono>
 #include <thread>
 #include <ctime>
@@ -96,37 +339,444 @@ fn wait_until(double target)
     end
 end
 """,
-        "modules/std/random.pypp": """
+    "modules/std/bench.pypp": """
+#include <algorithm>
+#include <chrono>
 #include <cmath>
+#include <cstdio>
+#include <string>
+#include <vector>
+
+%> The runtime behind `bench "name" N ... end`. After a warm-up of a tenth of
+%> the runs, the body runs N times in samples of as many calls as take about a
+%> microsecond, so reading the clock costs little next to them. The summary
+%> gives the time per call in the fastest, median and 99th percentile sample,
+%> and calls per second over all of them.
+
+struct bench_result {
+    long long calls{0};
+    double min_ns{0};
+    double median_ns{0};
+    double p99_ns{0};
+    double ops_per_sec{0};
+};
+
+fn clock_ns() double
+    return std::chrono::duration<double, std::nano>(std::chrono::steady_clock::now().time_since_epoch()).count()
+end
+
+%> a compiler barrier: the body's stores can't be dropped or moved out of the timed loop
+fn clobber()
+    asm volatile("" ::: "memory");
+end
+
+%> makes the compiler compute value even if nothing uses it
+template <class T>
+fn keep(const T& value)
+    asm volatile("" : : "r,m"(value) : "memory");
+end
+
+fn format_ns(double ns) strT
+    char buf[32];
+    if ns < 1e3
+        std::snprintf(buf, sizeof buf, "%.1f ns", ns);
+    elif ns < 1e6
+        std::snprintf(buf, sizeof buf, "%.2f us", ns / 1e3);
+    elif ns < 1e9
+        std::snprintf(buf, sizeof buf, "%.2f ms", ns / 1e6);
+    else
+        std::snprintf(buf, sizeof buf, "%.3f s", ns / 1e9);
+    end
+    return buf
+end
+
+fn format_rate(double ops) strT
+    char buf[32];
+    if ops >= 1e9
+        std::snprintf(buf, sizeof buf, "%.2fG", ops / 1e9);
+    elif ops >= 1e6
+        std::snprintf(buf, sizeof buf, "%.2fM", ops / 1e6);
+    elif ops >= 1e3
+        std::snprintf(buf, sizeof buf, "%.2fK", ops / 1e3);
+    else
+        std::snprintf(buf, sizeof buf, "%.2f", ops);
+    end
+    return buf
+end
+
+fn report(const char* name, const bench_result& r)
+    std::string fastest = format_ns(r.min_ns)
+    std::string median = format_ns(r.median_ns)
+    std::string slow = format_ns(r.p99_ns)
+    std::string rate = format_rate(r.ops_per_sec)
+    print("bench ", name, ": ", r.calls, " runs, min ", fastest, ", median ", median, ", p99 ", slow, ", ", rate, " ops/s\\n")
+end
+
+template <class F>
+fn run(const char* name, long long runs, F&& body) bench_result
+    runs = std::max(1LL, runs);
+    long long warm = std::max(1LL, runs / 10)
+    double began = clock_ns()
+    for (long long i = 0; i < warm; i++) { body(); clobber(); }
+    double per_call = (clock_ns() - began) / warm
+    long long batch = std::min(runs, (long long)(1000 / std::max(per_call, 1.0)) + 1)
+
+    std::vector<double> samples;
+    samples.reserve(runs / batch + 1);
+    double elapsed = 0
+    for (long long done = 0; done < runs;) {
+        long long n = std::min(batch, runs - done);
+        double t0 = clock_ns();
+        for (long long i = 0; i < n; i++) { body(); clobber(); }
+        double took = clock_ns() - t0;
+        samples.push_back(took / n);
+        elapsed += took;
+        done += n;
+    }
+    std::sort(samples.begin(), samples.end());
+
+    bench_result r;
+    r.calls = runs
+    r.min_ns = samples.front()
+    r.median_ns = samples[(samples.size() - 1) / 2]
+    r.p99_ns = samples[(std::size_t)std::ceil(samples.size() * 0.99) - 1]
+    r.ops_per_sec = elapsed > 0 ? runs * 1e9 / elapsed : 0
+    report(name, r)
+    return r
+end
+""",
+    "modules/std/parallel.pypp": """
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <cstdlib>
+#include <exception>
+#include <functional>
+#include <iterator>
+#include <limits>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+%> The thread pool behind pforeach and prepeat. A loop is cut into chunks that the
+%> calling thread and the workers take from a shared counter, so uneven chunks
+%> even out. A loop started inside a loop body runs on the thread it was started from.
+%> Threads: $PYPP_THREADS or the number of cores, or parallel_set_threads(n).
+%> Chunks: parallel_set_chunk(n) iterations; 0, the default, makes about 8 per thread.
+
+struct parallel_pool {
+    std::vector<std::thread> workers;
+    std::mutex lock;
+    std::mutex one_loop;
+    std::condition_variable wake;
+    std::condition_variable finished;
+    std::function<void()> job;
+    std::size_t generation{0};
+    std::size_t done{0};
+    bool stopping{false};
+
+    explicit parallel_pool(std::size_t helpers) {
+        for (std::size_t i = 0; i < helpers; i++) workers.emplace_back([this] { work(); });
+    }
+
+    ~parallel_pool() {
+        std::unique_lock<std::mutex> guard(lock);
+        stopping = true;
+        guard.unlock();
+        wake.notify_all();
+        for (auto& t : workers) t.join();
+    }
+
+    void work() {
+        std::size_t seen = 0;
+        for (;;) {
+            std::unique_lock<std::mutex> guard(lock);
+            wake.wait(guard, [&] { return stopping || generation != seen; });
+            if stopping
+                return
+            end
+            seen = generation;
+            guard.unlock();
+            job();
+            guard.lock();
+            ++done;
+            guard.unlock();
+            finished.notify_one();
+        }
+    }
+
+    %> runs task on every worker and the calling thread, and returns once all are done
+    void run(const std::function<void()>& task) {
+        std::lock_guard<std::mutex> exclusive(one_loop);
+        std::unique_lock<std::mutex> guard(lock);
+        job = task;
+        done = 0;
+        ++generation;
+        guard.unlock();
+        wake.notify_all();
+        task();
+        guard.lock();
+        finished.wait(guard, [&] { return done == workers.size(); });
+    }
+};
+
+struct parallel_config {
+    std::size_t thread_count{0};
+    std::size_t chunk{0};
+    std::unique_ptr<parallel_pool> instance;
+};
+
+fn settings() parallel_config&
+    static parallel_config s;
+    return s
+end
+
+fn threads() std::size_t
+    parallel_config& s = settings()
+    if s.thread_count == 0
+        const char* env = std::getenv("PYPP_THREADS")
+        s.thread_count = env ? std::strtoul(env, nullptr, 10) : 0
+    end
+    if s.thread_count == 0
+        s.thread_count = std::max(1u, std::thread::hardware_concurrency())
+    end
+    return s.thread_count
+end
+
+%> 0 goes back to the default
+fn set_threads(std::size_t n)
+    parallel_config& s = settings()
+    s.instance.reset()
+    s.thread_count = n
+end
+
+fn set_chunk(std::size_t n)
+    settings().chunk = n
+end
+
+fn chunk_for(std::size_t n) std::size_t
+    std::size_t chunk = settings().chunk
+    return chunk ? chunk : std::max<std::size_t>(1, n / (threads() * 8))
+end
+
+fn shared_pool() parallel_pool&
+    parallel_config& s = settings()
+    if !s.instance
+        s.instance = std::make_unique<parallel_pool>(threads() - 1)
+    end
+    return *s.instance
+end
+
+fn in_loop() bool&
+    static thread_local bool flag = false;
+    return flag
+end
+
+%> calls body(k, first, last) for the k-th chunk [first, last) of [0, n)
+template <class F>
+fn for_chunks(std::size_t n, std::size_t chunk, F&& body)
+    std::size_t count = (n + chunk - 1) / chunk
+    if count < 2 || in_loop() || threads() == 1
+        for (std::size_t k = 0; k < count; k++) body(k, k * chunk, std::min(n, k * chunk + chunk));
+        return
+    end
+    std::atomic<std::size_t> next{0};
+    std::exception_ptr error;
+    std::mutex error_lock;
+    shared_pool().run([&] {
+        in_loop() = true;
+        try
+            for (std::size_t k; (k = next.fetch_add(1)) < count;) body(k, k * chunk, std::min(n, k * chunk + chunk));
+        catch ...
+            std::lock_guard<std::mutex> guard(error_lock);
+            if !error
+                error = std::current_exception()
+            end
+            next = count
+        end
+        in_loop() = false;
+    });
+    if error
+        std::rethrow_exception(error)
+    end
+end
+
+%> containers need size() and [] (vectors, arrays, strings, ranges)
+template <class C, class F>
+fn for_each(C&& c, F&& body)
+    std::size_t n = std::size(c)
+    for_chunks(n, chunk_for(n), [&](std::size_t, std::size_t first, std::size_t last) { for (std::size_t i = first; i < last; i++) body(c[i]); });
+end
+
+template <class F>
+fn repeat(long long n, F&& body)
+    std::size_t total = n > 0 ? (std::size_t)n : 0
+    for_chunks(total, chunk_for(total), [&](std::size_t, std::size_t first, std::size_t last) { for (std::size_t i = first; i < last; i++) body((long long)i); });
+end
+
+%> Each chunk folds into its own copy of identity; the copies are then combined
+%> into acc in chunk order, so the result is the same for any scheduling.
+template <class C, class T, class Combine, class F>
+fn reduce(C&& c, T& acc, T identity, Combine combine, F&& body)
+    std::size_t n = std::size(c)
+    std::size_t chunk = chunk_for(n)
+    std::vector<T> partial((n + chunk - 1) / chunk, identity);
+    for_chunks(n, chunk, [&](std::size_t k, std::size_t first, std::size_t last) {
+        T local = identity;
+        for (std::size_t i = first; i < last; i++) body(c[i], local);
+        partial[k] = local;
+    });
+    for (const T& p : partial) acc = combine(acc, p);
+end
+
+template <class C, class T, class F>
+fn reduce_sum(C&& c, T& acc, F&& body)
+    reduce(c, acc, T{}, [](const T& a, const T& b) { return a + b; }, body)
+end
+
+template <class C, class T, class F>
+fn reduce_min(C&& c, T& acc, F&& body)
+    reduce(c, acc, std::numeric_limits<T>::max(), [](const T& a, const T& b) { return b < a ? b : a; }, body)
+end
+
+template <class C, class T, class F>
+fn reduce_max(C&& c, T& acc, F&& body)
+    reduce(c, acc, std::numeric_limits<T>::lowest(), [](const T& a, const T& b) { return a < b ? b : a; }, body)
+end
+""",
+    "modules/std/random.pypp": """
+#include <chrono>
+#include <cstdint>
+#include <utility>
+#include <vector>
 imp std/time.pypp
 
+%> xoshiro256** (Blackman & Vigna), seeded through splitmix64.
+%> Seeded from the clock on first use; call random_seed(n) for reproducible runs.
+
+fn splitmix64(std::uint64_t& x) std::uint64_t
+    std::uint64_t z = (x += 0x9E3779B97F4A7C15ULL)
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL
+    return z ^ (z >> 31)
+end
+
+fn engine() std::uint64_t*
+    static std::uint64_t s[4];
+    static bool seeded = false;
+    if !seeded
+        std::uint64_t x = (std::uint64_t)std::chrono::steady_clock::now().time_since_epoch().count()
+        for (int i = 0; i < 4; i++) s[i] = splitmix64(x);
+        seeded = true
+    end
+    return s
+end
+
+fn seed(std::uint64_t value)
+    std::uint64_t* s = engine()
+    for (int i = 0; i < 4; i++) s[i] = splitmix64(value);
+end
+
+fn rotl(std::uint64_t x, int k) std::uint64_t
+    return (x << k) | (x >> (64 - k))
+end
+
+fn step(std::uint64_t* s) std::uint64_t
+    std::uint64_t result = rotl(s[1] * 5, 7) * 9
+    std::uint64_t t = s[1] << 17
+    s[2] ^= s[0]
+    s[3] ^= s[1]
+    s[1] ^= s[2]
+    s[0] ^= s[3]
+    s[2] ^= t
+    s[3] = rotl(s[3], 45)
+    return result
+end
+
+%> maps 64 random bits onto [0, span) with a multiply instead of a division:
+%> the high half of the 128-bit product, pieced together from 32-bit halves
+%> where the compiler has no 128-bit integers (32-bit MinGW)
+fn bounded(std::uint64_t r, std::uint64_t span) std::uint64_t
+#ifdef __SIZEOF_INT128__
+    return (std::uint64_t)(((unsigned __int128)r * span) >> 64)
+#else
+    std::uint64_t r_lo = r & 0xFFFFFFFFULL
+    std::uint64_t r_hi = r >> 32
+    std::uint64_t span_lo = span & 0xFFFFFFFFULL
+    std::uint64_t span_hi = span >> 32
+    std::uint64_t cross = r_hi * span_lo + ((r_lo * span_lo) >> 32)
+    std::uint64_t carry = (r_lo * span_hi + (cross & 0xFFFFFFFFULL)) >> 32
+    return r_hi * span_hi + (cross >> 32) + carry
+#endif
+end
+
+fn to01(std::uint64_t r) double
+    return (r >> 11) * 0x1.0p-53
+end
+
+fn next_u64() std::uint64_t
+    return step(engine())
+end
 
 fn rand01() double
-    double __seed = fmod(time_now_() * 6364136223846793005.0 * time_since(1) + 1.0, 1e9)
-    return fmod(__seed / 1e9, 1.0)
+    return to01(step(engine()))
 end
 
 fn randint(int a, int b) int
-    return a + (int)(rand01() * (b - a + 1))
+    if b < a
+        std::swap(a, b)
+    end
+    return a + (int)bounded(step(engine()), (std::uint64_t)((long long)b - a + 1))
 end
 
 fn uniform(double a, double b) double
-    return a + rand01() * (b - a)
+    return a + to01(step(engine())) * (b - a)
 end
 
 fn randlen(int length) int
     if length <= 0
         return 0
     end
-    int num = randint(1, 9); 
-    for (int i = 1; i < length; i++) {
-        int digit = randint(0, 9);
-        num = num * 10 + digit;
-    }
-    return num
+    %> an int holds at most 9 full digits
+    int low = 1
+    for (int i = 1; i < length && i < 9; i++) low *= 10;
+    return randint(low, low * 10 - 1)
+end
+
+%> bulk generation: the state stays in registers for the whole loop
+
+fn fill_randint(vec<int>& out, int a, int b)
+    if b < a
+        std::swap(a, b)
+    end
+    std::uint64_t span = (std::uint64_t)((long long)b - a + 1)
+    std::uint64_t* s = engine()
+    std::uint64_t local[4] = {s[0], s[1], s[2], s[3]};
+    for (auto& x : out) x = a + (int)bounded(step(local), span);
+    for (int i = 0; i < 4; i++) s[i] = local[i];
+end
+
+fn fill_uniform(vec<double>& out, double a, double b)
+    std::uint64_t* s = engine()
+    std::uint64_t local[4] = {s[0], s[1], s[2], s[3]};
+    for (auto& x : out) x = a + to01(step(local)) * (b - a);
+    for (int i = 0; i < 4; i++) s[i] = local[i];
+end
+
+fn randints(int n, int a, int b) vec<int>
+    vec<int> values(n);
+    fill_randint(values, a, b)
+    return values
+end
+
+fn uniforms(int n, double a, double b) vec<double>
+    vec<double> values(n);
+    fill_uniform(values, a, b)
+    return values
 end
 """,
-        "modules/std/sys.pypp": """
+    "modules/std/sys.pypp": """
 #include <string>
 
 #ifdef _WIN32
@@ -151,66 +801,160 @@ fn get_username() strT
 #endif
 end
 """,
-        "modules/std/strOps.pypp": """
+    "modules/std/strOps.pypp": """
 #include <algorithm>
 #include <cctype>
 #include <string>
+#include <string_view>
+#include <vector>
 
-fn trim(const std::string& s) strT
-    size_t start = 0
-    while start < s.size() && std::isspace(s[start]) 
+%> The *_view functions return views into their argument, which has to outlive them.
+
+fn trim_view(std::string_view s) std::string_view
+    std::size_t start = 0
+    while start < s.size() && std::isspace((unsigned char)s[start])
         start++
     end
-    size_t end = s.size()
-    while end > start && std::isspace(s[end - 1])
-        end--
+    std::size_t stop = s.size()
+    while stop > start && std::isspace((unsigned char)s[stop - 1])
+        stop--
     end
-    return s.substr(start, end - start)
+    return s.substr(start, stop - start)
+end
+
+fn trim(const std::string& s) strT
+    return std::string(trim_view(s))
+end
+
+%> ASCII only, like std::tolower in the default "C" locale, but branch-free so it vectorizes
+fn lower_inplace(std::string& s)
+    for (char& c : s) c = (unsigned char)(c - 'A') < 26 ? c | 0x20 : c;
+end
+
+fn upper_inplace(std::string& s)
+    for (char& c : s) c = (unsigned char)(c - 'a') < 26 ? c & ~0x20 : c;
 end
 
 fn lower(std::string s) strT
-    std::transform(s.begin(), s.end(), s.begin(), [](unsigned char c){ return std::tolower(c); });
+    lower_inplace(s)
     return s
 end
 
 fn upper(std::string s) strT
-    std::transform(s.begin(), s.end(), s.begin(), [](unsigned char c){ return std::toupper(c); });
+    upper_inplace(s)
     return s
 end
 
-fn split(const std::string& s, char delimiter) strvec
+%> Walks the fields of a text between delimiters without copying them. Like split,
+%> "a,,b" has an empty middle field and "" has one empty field.
+struct strOps_split_iterator {
+    std::string_view rest;
+    std::string_view delimiter;
+    std::string_view cur;
+    bool last{false};
+    bool done{true};
+
+    strOps_split_iterator() = default;
+    strOps_split_iterator(std::string_view s, std::string_view d) : rest(s), delimiter(d), done(false) { advance(); }
+
+    const std::string_view& operator*() const { return cur; }
+    bool operator!=(const strOps_split_iterator& o) const { return done != o.done; }
+    strOps_split_iterator& operator++() { advance(); return *this; }
+
+    void advance() {
+        if last
+            done = true
+            return
+        end
+        %> an empty delimiter never matches
+        std::size_t at = delimiter.size() == 1 ? rest.find(delimiter[0]) : delimiter.empty() ? std::string_view::npos : rest.find(delimiter);
+        if at == std::string_view::npos
+            cur = rest
+            last = true
+        else
+            cur = rest.substr(0, at)
+            rest.remove_prefix(at + delimiter.size())
+        end
+    }
+};
+
+%> The fields of a text, for use with foreach; the text and the delimiter have to outlive the loop.
+struct strOps_splitter {
+    std::string_view text;
+    std::string_view delimiter;
+
+    strOps_split_iterator begin() const { return strOps_split_iterator(text, delimiter); }
+    strOps_split_iterator end() const { return strOps_split_iterator(); }
+};
+
+fn each_split(std::string_view s, std::string_view delimiter) strOps_splitter
+    return strOps_splitter{s, delimiter};
+end
+
+%> one cheap pass to count the fields, so the vector is allocated once
+fn count_fields(std::string_view s, std::string_view delimiter) std::size_t
+    std::size_t count = 0
+    for (strOps_split_iterator it(s, delimiter), stop; it != stop; ++it) count++;
+    return count
+end
+
+fn split_view(std::string_view s, std::string_view delimiter) vec<std::string_view>
+    vec<std::string_view> parts
+    parts.reserve(count_fields(s, delimiter))
+    for (std::string_view part : each_split(s, delimiter)) parts.push_back(part);
+    return parts
+end
+
+fn split_view(std::string_view s, char delimiter) vec<std::string_view>
+    return split_view(s, std::string_view(&delimiter, 1))
+end
+
+fn split(std::string_view s, std::string_view delimiter) strvec
     strvec result;
-    size_t start = 0, end;
-    while (end = s.find(delimiter, start)) != std::string::npos
-        result.push_back(s.substr(start, end - start));
-        start = end + 1;
-    end
-    result.push_back(s.substr(start));
+    result.reserve(count_fields(s, delimiter))
+    for (std::string_view part : each_split(s, delimiter)) result.emplace_back(part);
     return result
 end
 
-fn join(const strvec& s, char delimiter) strT
+fn split(std::string_view s, char delimiter) strvec
+    return split(s, std::string_view(&delimiter, 1))
+end
+
+%> for strvec and vec<std::string_view> alike; the result is sized before anything is copied
+template <class Strings>
+fn join(const Strings& parts, std::string_view delimiter) strT
+    std::size_t total = parts.empty() ? 0 : delimiter.size() * (parts.size() - 1)
+    for (const auto& part : parts) total += std::string_view(part).size();
     std::string result;
-    for (size_t i = 0; i < s.size(); i++) {
-        result += s[i];
-        if (i < s.size() - 1)
-            result += delimiter;
+    result.reserve(total)
+    for (std::size_t i = 0; i < parts.size(); i++) {
+        if i
+            result += delimiter
         end
+        result += std::string_view(parts[i])
     }
     return result
 end
+
+fn join(const strvec& s, char delimiter) strT
+    return join(s, std::string_view(&delimiter, 1))
+end
 """,
-        "modules/std/__init__.pypp": """
+    "modules/std/__init__.pypp": """
 imp std/fileOps.pypp
 imp std/time.pypp
 imp std/random.pypp
 imp std/strOps.pypp
 imp std/sys.pypp
 """,
-    }
+}
+
+
+def setup_install(target_dir: str):
+    os.makedirs(os.path.join(target_dir, "modules"), exist_ok=True)
 
     # Write built-in modules
-    for rel, content in builtins.items():
+    for rel, content in BUILTIN_MODULES.items():
         path = os.path.join(target_dir, rel)
         os.makedirs(os.path.dirname(path), exist_ok=True)
         with open(path, "w", encoding="utf-8") as f:
@@ -247,6 +991,17 @@ imp std/sys.pypp
     print("[*] Restart your terminal to use the 'py++' command globally!\n")
 
 
+@lru_cache(maxsize=None)
+def gpp_version() -> str:
+    result = subprocess.run(
+        ["g++", "--version"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return result.stdout
+
+
 def check_gpp_installed() -> bool:
     try:
         result = subprocess.run(
@@ -265,84 +1020,492 @@ def check_gpp_installed() -> bool:
 # ---------------------------------------------------------------------------
 
 
-def safe_replace(line: str, name: str, replacement: str) -> str:
+_RENAME_TOKEN = re.compile(r'"|\w+')
+
+
+def rename_symbols(line: str, table: Dict[str, str]) -> str:
+    """Replace every standalone identifier of `line` found in `table`, in one scan."""
     if line.lstrip().startswith("%>"):  # full-line comment
         return line
 
-    new_line = ""
-    i = 0
+    parts: List[str] = []
+    last = 0
     in_str = False
-    while i < len(line):
-        c = line[i]
-        if c == '"' and (i == 0 or line[i - 1] != "\\"):
-            in_str = not in_str
-            new_line += c
-            i += 1
+    for m in _RENAME_TOKEN.finditer(line):
+        tok = m.group()
+        if tok == '"':
+            i = m.start()
+            if i == 0 or line[i - 1] != "\\":
+                in_str = not in_str
             continue
         if in_str:
-            new_line += c
-            i += 1
             continue
 
-        # try to match the function name as a standalone token
-        if line[i : i + len(name)] == name:
-            before = line[i - 1] if i > 0 else " "
-            after = line[i + len(name)] if i + len(name) < len(line) else " "
-            if (
-                not before.isalnum()
-                and before != "_"
-                and not after.isalnum()
-                and after != "_"
-            ):
-                new_line += replacement
-                i += len(name)
-                continue
+        replacement = table.get(tok)
+        if replacement is not None:
+            parts.append(line[last : m.start()])
+            parts.append(replacement)
+            last = m.end()
+
+    if not parts:
+        return line
+    parts.append(line[last:])
+    return "".join(parts)
 
-        new_line += c
-        i += 1
-    return new_line
 
+def safe_replace(line: str, name: str, replacement: str) -> str:
+    return rename_symbols(line, {name: replacement})
+
+
+def build_rename_table(mod_name: str, symbols: List[str]) -> Dict[str, str]:
+    # symbols used to be renamed one sweep at a time, in order, so a renamed
+    # token could be picked up again by a later symbol; keep that behaviour
+    positions: Dict[str, List[int]] = {}
+    for idx, name in enumerate(symbols):
+        positions.setdefault(name, []).append(idx)
+
+    table = {}
+    for name in positions:
+        current, idx = name, -1
+        while True:
+            later = [p for p in positions.get(current, ()) if p > idx]
+            if not later:
+                break
+            idx = later[0]
+            current = f"{mod_name}_{current}"
+        table[name] = current
+    return table
+
+
+# Each imported module's output is wrapped in marker comments, so the module
+# boundaries survive into the merged source (see split_units). An import that
+# was already loaded elsewhere leaves a "uses" marker instead. Full-line %>
+# comments are neither renamed nor transpiled.
+MODULE_BEGIN = "%> pypp:module "
+MODULE_END = "%> pypp:end "
+MODULE_USES = "%> pypp:uses "
+
+GLOBAL_PATTERN = re.compile(
+    r"^(?:const\s+)?(int|float|double|char|bool|auto|std::string|std::vector<[^>]+>)\s+([a-zA-Z0-9_]\w*)(\s*)?(=.*)?$"
+)
+
+
+def module_id(path: str) -> str:
+    """Unique, stable name of the module at `path` (module names alone may repeat)."""
+    norm_path = os.path.abspath(path)
+    mod_name = os.path.splitext(os.path.basename(norm_path))[0]
+    return f"{mod_name}-{content_hash(norm_path)[:8]}"
 
-def load_with_imports_renamed(
-    path: str,
-    loaded: Optional[Set[str]] = None,
-    base_dir: Optional[str] = None,
-    is_main: bool = True,
-    apply_macros_everywhere: bool = False,
-):
-    if loaded is None:
-        loaded = set()
 
-    # exe dir (global modules)
-    exe_dir = os.path.dirname(
+def install_dir() -> str:
+    """Directory of the running py++ (script or frozen exe); global modules live here."""
+    return os.path.dirname(
         sys.executable if getattr(sys, "frozen", False) else os.path.abspath(__file__)
     )
 
-    if base_dir is None:
-        base_dir = os.path.dirname(os.path.abspath(path))
-
-    norm_path = os.path.abspath(path)
-    if norm_path in loaded:
-        return ""
-    loaded.add(norm_path)
-
-    if not os.path.exists(path):
-        print(f"[Py++] Error: file '{path}' not found")
-        sys.exit(404)
-
-    with open(path, "r", encoding="utf-8") as f:
-        raw_src = f.read()
 
-    if apply_macros_everywhere:
-        src = raw_src
-    else:
-        src = preprocess_defines(raw_src)
+def cache_dir() -> str:
+    return os.environ.get("PYPP_CACHE") or os.path.join(install_dir(), "cache")
 
 
-    out_lines = []
+# ---------------------------------------------------------------------------
+#  Module cache: renamed module output, keyed by content and import state
+# ---------------------------------------------------------------------------
 
-    mod_name = None if is_main else os.path.splitext(os.path.basename(path))[0]
-    func_names, var_names = [], []
+# bump whenever the output of load_with_imports_renamed changes for the same input
+MODULE_CACHE_VERSION = 4
+# contexts (sets of already loaded imports) kept per cached module
+MODULE_CACHE_VARIANTS = 8
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ModuleCache:
+    """Renamed output of imported modules, on disk and in memory (see watch).
+
+    An entry is reused while its sources are unchanged and the same imports are loaded.
+    """
+
+    def __init__(self, directory: Optional[str], max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # key -> (module path, variants); see get for the fields of a variant
+        self.memory: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+        # path -> ((mtime, size), content hash), so unchanged files are not re-read
+        self.file_hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+    @classmethod
+    def from_env(cls) -> "ModuleCache":
+        directory = os.path.join(cache_dir(), "modules")
+        max_mb = os.environ.get("PYPP_CACHE_MB")
+        if max_mb:
+            return cls(directory, int(float(max_mb) * 1024 * 1024))
+        return cls(directory)
+
+    def key(
+        self,
+        path: str,
+        src: str,
+        defines: Optional[Defines],
+        apply_macros_everywhere: bool,
+    ) -> str:
+        # inherited defines only matter with -d; imports are checked by get
+        parts = [
+            str(MODULE_CACHE_VERSION),
+            path,
+            content_hash(src),
+            repr(sorted(PRELUDE_DEFINES.items())),
+        ]
+        if apply_macros_everywhere:
+            parts.append(repr(sorted((defines or {}).items())))
+        return content_hash("\n".join(parts))
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def file_hash(self, path: str) -> str:
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        known = self.file_hashes.get(path)
+        if known is not None and known[0] == stamp:
+            return known[1]
+        with open(path, "r", encoding="utf-8") as f:
+            digest = content_hash(f.read())
+        self.file_hashes[path] = (stamp, digest)
+        return digest
+
+    def _variants(self, key: str) -> List[Dict[str, Any]]:
+        if key in self.memory:
+            return self.memory[key][1]
+        if self.directory is None:
+            return []
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                variants = json.load(f)["variants"]
+            os.utime(entry_path)  # mark as recently used
+        except (OSError, ValueError, KeyError, TypeError):
+            return []
+        return variants if isinstance(variants, list) else []
+
+    def get(
+        self, key: str, loaded: Set[str], index: "ModuleIndex"
+    ) -> Optional[Tuple[str, Dict[str, str], Imports]]:
+        """Return (output, input file hashes, imports reached) for `key`.
+
+        Only a variant whose input files are unchanged, whose skipped imports
+        are exactly the ones of its reached imports in `loaded`, and whose
+        imports all still resolve to the same files in `index`, is used.
+        """
+        for variant in self._variants(key):
+            try:
+                output, deps = variant["output"], dict(variant["deps"])
+                uses = {(base, target): file for base, target, file in variant["uses"]}
+                if any(dep in loaded for dep in deps):
+                    continue
+                if any(file not in loaded for file in uses.values() if file not in deps):
+                    continue
+                if any(index.resolve(target, base) != file for (base, target), file in uses.items()):
+                    continue
+                if all(self.file_hash(dep) == digest for dep, digest in deps.items()):
+                    self.hits += 1
+                    return output, deps, uses
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def _skipped(variant: Dict[str, Any]) -> List[str]:
+        built = {dep for dep, _ in variant.get("deps", ())}
+        return sorted({file for _, _, file in variant.get("uses", ()) if file not in built})
+
+    def put(self, key: str, path: str, output: str, deps: Dict[str, str], uses: Imports):
+        """Store the output of `path` built from `deps` after reaching the imports `uses`."""
+        new = {
+            "deps": sorted(deps.items()),
+            "uses": sorted([base, target, file] for (base, target), file in uses.items()),
+            "output": output,
+        }
+        # the same context again (or an older build of it) is replaced
+        variants = [v for v in self._variants(key) if self._skipped(v) != self._skipped(new)]
+        variants.append(new)
+        variants = variants[-MODULE_CACHE_VARIANTS:]
+        # an edited module replaces its old entry instead of piling up
+        for old in [k for k, entry in self.memory.items() if entry[0] == path and k != key]:
+            del self.memory[old]
+        self.memory[key] = (path, variants)
+        if self.directory is None:
+            return
+
+        entry_path = self._entry_path(key)
+        tmp = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"variants": variants}, f)
+            os.replace(tmp, entry_path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def trim(self):
+        if self.directory is not None:
+            trim_directory(self.directory, self.max_bytes)
+
+
+def trim_directory(directory: str, max_bytes: int, keep: Tuple[str, ...] = ()):
+    """Delete least recently used files under `directory` until it fits in max_bytes."""
+    entries = []
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            entry_path = os.path.join(root, name)
+            try:
+                st = os.stat(entry_path)
+            except OSError:
+                continue
+            total += st.st_size
+            if name not in keep:
+                entries.append((st.st_mtime, st.st_size, entry_path))
+    entries.sort()
+    for _, size, entry_path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(entry_path)
+        except OSError:
+            continue
+        total -= size
+
+
+# ---------------------------------------------------------------------------
+#  Module search path
+# ---------------------------------------------------------------------------
+
+
+def module_search_path(args: List[str]) -> List[str]:
+    """Directories `imp` searches, in order: --module-path, $PYPP_PATH, then the installed modules."""
+    roots = option_values(args, "--module-path")
+    roots += [entry for entry in os.environ.get("PYPP_PATH", "").split(os.pathsep) if entry]
+    roots.append(os.path.join(install_dir(), "modules"))
+    if os.name == "nt":
+        roots.append(r"C:\pypp\modules")  # where the installer puts them
+    unique: List[str] = []
+    for root in roots:
+        root = os.path.abspath(root)
+        if root not in unique:
+            unique.append(root)
+    return unique
+
+
+def import_name(target: str) -> str:
+    """The key of an `imp` target in the index: `std\\strOps.pypp/` is `std/strOps.pypp`."""
+    return posixpath.normpath(os.path.normcase(target).replace("\\", "/"))
+
+
+def dir_stamp(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ModuleIndex:
+    """Every module on the search path, found once per build, by import name.
+
+    A module is a .pypp file, or a directory with an __init__.pypp, named
+    by its path below a search directory; the first directory that has it
+    wins. Imports not in the index are looked up next to the importing
+    file. With a `store` file the index of each search directory is saved,
+    and reused while none of its directories changed (adding or removing a
+    file changes its directory), so an unchanged tree is not walked again.
+    """
+
+    def __init__(self, roots: List[str], store: Optional[str] = None):
+        self.roots = roots
+        self.store = store
+        self.modules: Dict[str, str] = {}  # import name -> file
+        self._local: Dict[Tuple[str, str], Optional[str]] = {}
+        saved = self._load()
+        changed = False
+        for root in roots:
+            entry = saved.get(root)
+            if entry is None or any(dir_stamp(d) != stamp for d, stamp in entry["dirs"].items()):
+                entry = saved[root] = self.scan(root)
+                changed = True
+            for name, path in entry["modules"].items():
+                self.modules.setdefault(name, path)
+        if changed:
+            self._save(saved)
+
+    @classmethod
+    def from_args(cls, args: List[str]) -> "ModuleIndex":
+        store = None if "--no-cache" in args else os.path.join(cache_dir(), "module-index.json")
+        return cls(module_search_path(args), store)
+
+    @staticmethod
+    def scan(root: str) -> Dict[str, Any]:
+        """The modules below `root`, and the modification time of each directory.
+
+        Linked directories are followed, but each directory is only read once,
+        so a link back up the tree cannot make the walk endless.
+        """
+        dirs: Dict[str, Optional[int]] = {root: dir_stamp(root)}
+        modules: Dict[str, str] = {}
+        seen: Set[Tuple[int, int]] = set()
+        for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+            try:
+                st = os.stat(dirpath)
+            except OSError:
+                dirnames[:] = []
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                dirnames[:] = []
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for d in dirnames:
+                dirs[os.path.join(dirpath, d)] = dir_stamp(os.path.join(dirpath, d))
+            rel = os.path.relpath(dirpath, root)
+            for name in filenames:
+                if name.endswith(".pypp"):
+                    modules[import_name(os.path.join(rel, name))] = os.path.join(dirpath, name)
+            if rel != "." and "__init__.pypp" in filenames:
+                modules[import_name(rel)] = os.path.join(dirpath, "__init__.pypp")
+        return {"dirs": dirs, "modules": modules}
+
+    def resolve(self, target: str, base_dir: str) -> Optional[str]:
+        """The file (an absolute path) `imp target` loads from a file in `base_dir`, or None."""
+        name = import_name(target)
+        path = self.modules.get(name)
+        if path is not None:
+            return path
+        key = (base_dir, name)
+        if key not in self._local:
+            local = os.path.abspath(os.path.join(base_dir, target))
+            if os.path.isdir(local):
+                local = os.path.join(local, "__init__.pypp")
+            self._local[key] = local if os.path.exists(local) else None
+        return self._local[key]
+
+    def _load(self) -> Dict[str, Any]:
+        if self.store is None:
+            return {}
+        try:
+            with open(self.store, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, saved: Dict[str, Any]):
+        if self.store is None:
+            return
+        tmp = f"{self.store}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.store), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(saved, f)
+            os.replace(tmp, self.store)
+        except OSError:
+            # a read-only install dir just means the index is rebuilt next time
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def load_with_imports_renamed(
+    path: str,
+    loaded: Optional[Set[str]] = None,
+    base_dir: Optional[str] = None,
+    is_main: bool = True,
+    apply_macros_everywhere: bool = False,
+    defines: Optional[Defines] = None,
+    cache: Optional[ModuleCache] = None,
+    deps: Optional[Dict[str, str]] = None,
+    index: Optional[ModuleIndex] = None,
+    uses: Optional[Imports] = None,
+):
+    # timed per file; the imports it loads are charged to themselves
+    with phase("load", module="main" if is_main else module_id(path)):
+        return _load_renamed(
+            path, loaded, base_dir, is_main, apply_macros_everywhere, defines, cache, deps, index,
+            uses,
+        )
+
+
+def _load_renamed(
+    path: str,
+    loaded: Optional[Set[str]],
+    base_dir: Optional[str],
+    is_main: bool,
+    apply_macros_everywhere: bool,
+    defines: Optional[Defines],
+    cache: Optional[ModuleCache],
+    deps: Optional[Dict[str, str]],
+    index: Optional[ModuleIndex],
+    uses: Optional[Imports],
+):
+    if loaded is None:
+        loaded = set()
+    if index is None:
+        index = ModuleIndex(module_search_path([]))
+
+    if base_dir is None:
+        base_dir = os.path.dirname(os.path.abspath(path))
+
+    norm_path = os.path.abspath(path)
+    if norm_path in loaded:
+        return ""
+
+    if not os.path.exists(path):
+        print(f"[Py++] Error: file '{path}' not found")
+        sys.exit(404)
+
+    with open(path, "r", encoding="utf-8") as f:
+        raw_src = f.read()
+    if PHASE_STATS:
+        PHASE_STATS.note_module("main" if is_main else module_id(path), lines=raw_src.count("\n") + 1)
+
+    # the main file changes on almost every build, so only imports are cached
+    cache_key = None
+    if cache is not None and not is_main:
+        cache_key = cache.key(norm_path, raw_src, defines, apply_macros_everywhere)
+        cached = cache.get(cache_key, loaded, index)
+        if cached is not None:
+            output, files, reached = cached
+            loaded.update(files)
+            if deps is not None:
+                deps.update(files)
+            if uses is not None:
+                uses.update(reached)
+            if PHASE_STATS:
+                PHASE_STATS.note_module(module_id(path), cached=True)
+            print(f"Imported {os.path.splitext(os.path.basename(path))[0]} (cached)")
+            return output
+
+    loaded.add(norm_path)
+    # files this module is built from: itself and everything it newly imports
+    own_deps: Dict[str, str] = {norm_path: content_hash(raw_src)}
+    # every import reached below it, loaded here or skipped as already loaded
+    own_uses: Imports = {}
+
+    # with -d, the defines of a module also apply to everything it imports
+    if defines is None or not apply_macros_everywhere:
+        defines = dict(PRELUDE_DEFINES)
+    else:
+        defines = dict(defines)
+    with phase("preprocess_defines"):
+        src = preprocess_defines(raw_src, defines)
+
+
+    out_lines = []
+
+    mod_name = None if is_main else os.path.splitext(os.path.basename(path))[0]
+    func_names, var_names = [], []
 
     if mod_name:
         print(f"Importing {mod_name}", end="\r")
@@ -354,30 +1517,27 @@ def load_with_imports_renamed(
         if stripped.startswith("imp "):
             imp_target = stripped[4:].strip()
 
-            # 1️⃣ check exe_dir/modules
-            submod_path = os.path.join(exe_dir, "modules", imp_target)
-            # 2️⃣ check in standard installation directory C:\pypp (where setup installs)
-            if not os.path.exists(submod_path):
-                standard_install_path = r"C:\pypp"
-                submod_path = os.path.join(
-                    standard_install_path, "modules", imp_target
-                )
-            # 3️⃣ fallback to local directory of current file
-            if not os.path.exists(submod_path):
-                submod_path = os.path.join(base_dir, imp_target)
-
-            if os.path.exists(submod_path):
-                # if the submodule is a directory
-                if os.path.isdir(submod_path):
-                    submod_path = os.path.join(submod_path, "__init__.pypp")
-                out_lines.append(
-                    load_with_imports_renamed(
-                        submod_path, loaded, os.path.dirname(submod_path), is_main=False, apply_macros_everywhere=apply_macros_everywhere
-                    )
+            # the search path first, then the directory of the current file
+            submod_path = index.resolve(imp_target, base_dir)
+            if submod_path is not None:
+                own_uses[(base_dir, imp_target)] = submod_path
+                submod = load_with_imports_renamed(
+                    submod_path,
+                    loaded,
+                    os.path.dirname(submod_path),
+                    is_main=False,
+                    apply_macros_everywhere=apply_macros_everywhere,
+                    defines=defines,
+                    cache=cache,
+                    deps=own_deps,
+                    index=index,
+                    uses=own_uses,
                 )
+                out_lines.append(submod or MODULE_USES + module_id(submod_path))
             else:
                 print(
-                    f"[Py++] Error: module '{imp_target}' not found in global or local paths"
+                    f"[Py++] Error: module '{imp_target}' not found in the module search path"
+                    f" ({os.pathsep.join(index.roots)}) or in {base_dir}"
                 )
                 sys.exit(404)
 
@@ -402,10 +1562,7 @@ def load_with_imports_renamed(
 
         # detect globals
         if mod_name:
-            v = re.match(
-                r"^(?:const\s+)?(int|float|double|char|bool|auto|std::string|std::vector<[^>]+>)\s+([a-zA-Z0-9_]\w*)(\s*)?(=.*)?$",
-                stripped,
-            )
+            v = GLOBAL_PATTERN.match(stripped)
             if v:
                 var_names.append(v.group(2))
 
@@ -415,18 +1572,27 @@ def load_with_imports_renamed(
 
     if mod_name and (func_names or var_names):
         all_symbols = func_names + var_names
-        for name in all_symbols:
-            renamed = f"{mod_name}_{name}"
-            combined = "\n".join(
-                safe_replace(line, name, renamed) for line in combined.splitlines()
-            )
+        table = build_rename_table(mod_name, all_symbols)
+        lines = combined.splitlines()
+        # each of the old per-symbol sweeps dropped one trailing blank line
+        for _ in range(len(all_symbols) - 1):
+            if not lines or lines[-1]:
+                break
+            lines.pop()
+        combined = "\n".join(rename_symbols(line, table) for line in lines)
 
         print(f"Imported {mod_name} ({len(func_names)} funcs, {len(var_names)} vars)")
 
-    if apply_macros_everywhere: 
-        combined = preprocess_defines(combined)
-
-
+    if mod_name:
+        unit = module_id(norm_path)
+        combined = f"{MODULE_BEGIN}{unit}\n{combined}\n{MODULE_END}{unit}"
+
+    if cache_key is not None:
+        cache.put(cache_key, norm_path, combined, own_deps, own_uses)
+    if deps is not None:
+        deps.update(own_deps)
+    if uses is not None:
+        uses.update(own_uses)
     return combined
 
 
@@ -435,23 +1601,14 @@ def load_with_imports_renamed(
 # ---------------------------------------------------------------------------
 
 
-def preprocess_defines(source: str) -> str:
-    # allow multiple args inside parentheses
-    define_pattern = re.compile(r"^define\s+([A-Za-z_]\w*)(?:\((.*?)\))?\s+(.+)$")
-    defines = {}
+DEFINE_PATTERN = re.compile(r"^define\s+([A-Za-z_]\w*)(?:\((.*?)\))?\s+(.+)$")
 
-    prelude = [
-        "define __argcv__ int argc, char** argv",
-        "define strvec std::vector<std::string>",
-        "define vec std::vector",
-        "define strT std::string",
-    ]
-
-    source_lines: List[str] = prelude + source.splitlines()
 
-    lines = []
-    for line in source_lines:
-        m = define_pattern.match(line.strip())
+def collect_defines(lines: List[str], defines: Defines) -> List[str]:
+    """Register every `define` line in `defines` and return the remaining lines."""
+    body = []
+    for line in lines:
+        m = DEFINE_PATTERN.match(line.strip())
         if m:
             name, args_str, value = m.groups()
             if args_str:
@@ -460,74 +1617,153 @@ def preprocess_defines(source: str) -> str:
                 args = []
             defines[name] = (args, value)
         else:
-            lines.append(line)
+            body.append(line)
+    return body
 
-    processed = "\n".join(lines)
 
-    # expand macros
-    for name, (args, value) in defines.items():
-        if args:
-            # match name( ... )
-            pattern = rf"\b{name}\(([^)]*)\)"
+PRELUDE_DEFINES: Defines = {}
+collect_defines(
+    [
+        "define __argcv__ int argc, char** argv",
+        "define strvec std::vector<std::string>",
+        "define vec std::vector",
+        "define strT std::string",
+    ],
+    PRELUDE_DEFINES,
+)
 
-            def repl(m):
-                call_args = [a.strip() for a in m.group(1).split(",")]
-                result = value
-                for arg_name, call_val in zip(args, call_args):
-                    # replace arg name with call value
-                    result = re.sub(rf"\b{re.escape(arg_name)}\b", call_val, result)
-                return f"{result}"
 
-            processed = re.sub(pattern, repl, processed)
-        else:
-            # plain replacement
-            processed = re.sub(rf"\b{name}\b", value, processed)
+@lru_cache(maxsize=None)
+def _macro_pattern(plain: Tuple[str, ...], funcs: Tuple[str, ...]):
+    alternatives = []
+    if plain:
+        alternatives.append(r"\b(?P<plain>" + "|".join(plain) + r")\b")
+    if funcs:
+        alternatives.append(r"\b(?P<func>" + "|".join(funcs) + r")\((?P<args>[^)]*)\)")
+    return re.compile("|".join(alternatives)) if alternatives else None
 
-    return processed
 
+@lru_cache(maxsize=None)
+def _param_pattern(params: Tuple[str, ...]):
+    return re.compile(r"\b(" + "|".join(re.escape(p) for p in params) + r")\b")
 
-def expand_ranges_outside_strings(src: str) -> str:
-    result = ""
-    in_str = False
-    quote_char = ""
-    i = 0
-    while i < len(src):
-        c = src[i]
-
-        # toggle string mode
-        if c in ('"', "'"):
-            if not in_str:
-                in_str = True
-                quote_char = c
-            elif src[i - 1] != "\\" and c == quote_char:
-                in_str = False
-            result += c
-            i += 1
-            continue
 
-        if not in_str:
-            # detect pattern like 3..8:2
-            m = re.match(r"([0-9-]+)\s*\.\.\s*([0-9-]+)(?::([0-9-]+))?", src[i:])
-            if m:
-                a, b = m.group(1), m.group(2)
-                c = m.group(3) or 1
-                # replace with range-based initializer list
-                result += (
-                    "{"
-                    + ",".join(
-                        str(j)
-                        for j in range(
-                            int(a), int(b) + 1 if int(b) > 0 else int(b) - 1, int(c)
-                        )
-                    )
-                    + "}"
-                )
-                i += m.end()
+def expand_macros(source: str, defines: Defines) -> str:
+    """Expand all macros of `source` in one scan, in definition order.
+
+    An expansion is only rescanned by macros defined after it (and by the prelude
+    defines), as when every define was applied in its own pass over the source.
+    """
+    pattern = _macro_pattern(
+        tuple(sorted(n for n, (args, _) in defines.items() if not args)),
+        tuple(sorted(n for n, (args, _) in defines.items() if args)),
+    )
+    if pattern is None:
+        return source
+
+    position = {name: at for at, name in enumerate(defines)}
+    everything = len(position)
+    expanded_plain: Dict[str, str] = {}
+
+    def expand(text: str, lo: int, hi: int) -> str:
+        out, pos = [], 0
+        m = pattern.search(text)
+        while m:
+            name = m.group("plain") or m.group("func")
+            at = position[name]
+            if not (lo <= at < hi or (at < lo and name in PRELUDE_DEFINES)):
+                # not this pass's macro; its arguments may still hold one
+                m = pattern.search(text, m.end("plain") if m.group("plain") else m.end("func"))
                 continue
+            out.append(text[pos:m.start()])
+            args, value = defines[name]
 
-        result += c
-        i += 1
-    return result
+            if not args:
+                if hi == everything and name in expanded_plain:
+                    out.append(expanded_plain[name])
+                else:
+                    result = expand(value, at + 1, hi)
+                    if hi == everything:
+                        expanded_plain[name] = result
+                    out.append(result)
+            else:
+                # the arguments were already expanded by the macros defined before
+                call_args = [expand(a.strip(), lo, at) for a in m.group("args").split(",")]
+                binding = dict(zip(args, call_args))
+                value = _param_pattern(tuple(binding)).sub(
+                    lambda a: binding[a.group(1)], value
+                )
+                out.append(expand(value, at + 1, hi))
+            pos = m.end()
+            m = pattern.search(text, pos)
+        out.append(text[pos:])
+        return "".join(out)
+
+    return expand(source, 0, everything)
+
+
+def preprocess_defines(source: str, defines: Optional[Defines] = None) -> str:
+    if defines is None:
+        defines = dict(PRELUDE_DEFINES)
+    lines = collect_defines(source.splitlines(), defines)
+    return expand_macros("\n".join(lines), defines)
+
+
+# literals end at the end of their line at the latest, so a stray quote only
+# affects its own line; %> and // comments are skipped
+RANGE_SCAN_PATTERN = re.compile(
+    r'"(?:\\[^\n]|[^"\\\n])*"?'
+    r"|'(?:\\[^\n]|[^'\\\n])*'?"
+    r"|%>[^\n]*|//[^\n]*"
+    r"|(?P<first>[0-9-]+)\s*\.\.\s*(?P<last>[0-9-]+)(?::(?P<step>[0-9-]+))?"
+)
+
+
+def expand_ranges_outside_strings(src: str) -> str:
+    # a..b:c becomes a lazy, inclusive __pypp_range (see the generated prelude)
+    return RANGE_SCAN_PATTERN.sub(expand_range, src)
+
+
+def expand_range(m) -> str:
+    if m.group("first") is None:  # a literal or comment
+        return m.group(0)
+    try:
+        first, last = int(m.group("first")), int(m.group("last"))
+        step = int(m.group("step") or 1)
+    except ValueError:
+        return m.group(0)
+    if step == 0:
+        print(f"[Py++] Error: range '{m.group(0)}' has a step of 0")
+        sys.exit(1)
+    return f"__pypp_range({first}, {last}, {step})"
+
+
+def iter_lines(text: str, chunk: int = 1 << 16) -> Iterator[str]:
+    """The lines of `text` as str.splitlines gives them, split `chunk` characters at a time."""
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + chunk)
+        if end < 0:
+            end = len(text)
+        yield from text[start:end].splitlines()
+        start = end + 1
+
+
+RANGE_BATCH = 256  # lines expand_ranges_lines scans at a time
+
+
+def expand_ranges_lines(lines: Iterable[str]) -> Iterator[str]:
+    """expand_ranges_outside_strings for a stream of lines (--stream).
+
+    No literal or comment spans lines, so each batch of lines is scanned on
+    its own and nothing is held back.
+    """
+    lines = iter(lines)
+    while True:
+        batch = list(islice(lines, RANGE_BATCH))
+        if not batch:
+            break
+        yield from expand_ranges_outside_strings("\n".join(batch)).split("\n")
 
 
 # ---------------------------------------------------------------------------
@@ -536,8 +1772,62 @@ def expand_ranges_outside_strings(src: str) -> str:
 
 
 class BlockFrame:
-    def __init__(self, kind: str):
+    def __init__(self, kind: str, close: str = "}", temps: Optional[Iterator[int]] = None):
         self.kind = kind
+        self.close = close  # what `end` emits for this block
+        # root frames only: numbers the temporaries of one output file (see assert_temp)
+        self.temps = temps
+
+
+RANGE_CALL_PATTERN = re.compile(r"^__pypp_range\((-?\d+), (-?\d+), (-?\d+)\)$")
+RANGE_EXPR_PATTERN = re.compile(r"^(.+?)\s*\.\.\s*(.+?)(?:\s*(?<!:):(?!:)\s*(.+))?$")
+
+
+def range_loop(var: str, first: str, last: str, step: str) -> str:
+    try:
+        step_value = int(step)
+    except ValueError:
+        return f"for (int {var} : __pypp_range({first}, {last}, {step})) {{"
+    cmp = "<=" if step_value > 0 else ">="
+    return f"for (int {var} = {first}; {var} {cmp} {last}; {var} += {step}) {{"
+
+
+def comprehension_loop(
+    varname: str, expr: str, var: str, container: str, cond: Optional[str]
+) -> List[str]:
+    """The loop that fills `varname` for `(expr foreach var container [if cond])`.
+
+    Without a filter the result is reserved up front (when the container has a
+    size). Ranges become counted loops, and a temporary container's elements
+    are moved out instead of copied.
+    """
+    lines = []
+    m_range = RANGE_CALL_PATTERN.match(container) or (
+        ".." in container and RANGE_EXPR_PATTERN.match(container)
+    )
+    if m_range:
+        first, last, step = m_range.groups()
+        step = step or "1"
+        if not cond:
+            lines.append(
+                f"__pypp_reserve_n({varname}, __pypp_range({first}, {last}, {step}).size(), 0);"
+            )
+        lines.append(range_loop(var, first, last, step))
+        value = expr
+    else:
+        lines.append("{")
+        lines.append(f"auto &&__pypp_src = {container};")
+        if not cond:
+            lines.append(f"__pypp_reserve({varname}, __pypp_src, 0);")
+        lines.append(f"for (auto &{var} : __pypp_src) {{")
+        value = f"__pypp_take<decltype(__pypp_src)>({var})" if expr.strip() == var else expr
+
+    push = f"{varname}.push_back({value});"
+    lines.append(f"    if ({cond}) {push}" if cond else f"    {push}")
+    lines.append("}")
+    if not m_range:
+        lines.append("}")
+    return lines
 
 
 def split_(s: str, sep: str = ",") -> List[str]:
@@ -557,14 +1847,354 @@ def split_(s: str, sep: str = ",") -> List[str]:
     return parts
 
 
+# ---------------------------------------------------------------------------
+#  Line handlers, dispatched on the first word of a line
+# ---------------------------------------------------------------------------
+
+# text with parentheses nested at most two deep
+BALANCED = r"(?:[^()]|\((?:[^()]|\([^()]*\))*\))+?"
+VEC_COMP_PATTERN = re.compile(
+    r"((?:std::vector<[^>]+>|std::vector<std::string>)\s+)?(\w+)\s*=\s*\((.+?)\s+foreach\s+(\w+)\s+"
+    rf"({BALANCED})(?:\s+if\s+({BALANCED}))?\)"
+)
+KEYWORD_PATTERN = re.compile(r"[A-Za-z_]\w*")
+IF_PATTERN = re.compile(r"^(if|elif)\s+(.*)$")
+CLS_PATTERN = re.compile(r"^cls\s([a-zA-Z0-9_]+)$")
+REPEAT_PATTERN = re.compile(r"^repeat\s+(.+?)$")
+PREPEAT_PATTERN = re.compile(r"^prepeat\s+(.+?)$")
+BENCH_PATTERN = re.compile(r'^bench\s+("(?:\\.|[^"\\])*")\s+(.+?)$')
+PFOREACH_PATTERN = re.compile(r"^pforeach\s+(\w+)\s+(.+?)(?:\s+(sum|min|max)\s+(\w+))?$")
+WHILE_PATTERN = re.compile(r"^while\s+(.*)$")
+CATCH_PATTERN = re.compile(r"^catch\s+(.*)$")
+FOREACH_PATTERN = re.compile(r"^foreach\s+(\w+)\s+(.*)$")
+FUNCDEF_PATTERN = re.compile(r"^(?:(const)\s+)?fn\s+([a-zA-Z0-9_]\w*)\s*\((.*)\)\s*(.*?)?$")
+LAMBDA_PATTERN = re.compile(r"lam:\s*([a-zA-Z0-9_]\w*)\s*\((.*)\)\s+=>\s+(.*?)$")
+RETURN_TUPLE_PATTERN = re.compile(r"^return\s+([a-zA-Z0-9_,\s]+]);$")
+
+
+def line_foreach(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = FOREACH_PATTERN.match(s)
+    if not m:
+        return False
+    var, arr = m.groups()
+    m_range = RANGE_CALL_PATTERN.match(arr) or (
+        ".." in arr and RANGE_EXPR_PATTERN.match(arr)
+    )
+    if m_range:
+        first, last, step = m_range.groups()
+        out_lines.append(range_loop(var, first, last, step or "1"))
+    else:
+        out_lines.append(f"for (auto &{var} : {arr}) {{")
+    block_stack.append(BlockFrame("foreach"))
+    return True
+
+
+def line_return_tuple(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = RETURN_TUPLE_PATTERN.match(s)
+    if not m:
+        return False
+    out_lines.append(f"return std::make_tuple({m.group(1)});")
+    return True
+
+
+def line_lambda(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = LAMBDA_PATTERN.match(s)
+    if not m:
+        return False
+    name, args, body = m.groups()
+    out_lines.append(f"auto {name} = [&]({args}) {{return {body};}};")
+    return True
+
+
+def line_while(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = WHILE_PATTERN.match(s)
+    if not m:
+        return False
+    out_lines.append(f"while ({m.group(1)}) {{")
+    block_stack.append(BlockFrame("while"))
+    return True
+
+
+def line_funcdef(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = FUNCDEF_PATTERN.match(s)
+    if not m:
+        return False
+    const, name, args, rettype = m.groups()
+    const_prefix = "const " if const else ""
+    out_lines.append(f"{const_prefix}{rettype or 'void'} {name}({args}) {{")
+    block_stack.append(BlockFrame("funcdef"))
+    return True
+
+
+def line_if(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = IF_PATTERN.match(s)
+    if not m:
+        return False
+    kw, cond = m.groups()
+    out_lines.append(f"{'if' if kw == 'if' else '} else if'} ({cond}) {{")
+    if kw == "elif":
+        block_stack.pop()
+    block_stack.append(BlockFrame(kw))
+    return True
+
+
+def line_else(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    if s != "else":
+        return False
+    out_lines.append("} else {")
+    block_stack.pop()
+    block_stack.append(BlockFrame("else"))
+    return True
+
+
+def line_try(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    if s != "try":
+        return False
+    out_lines.append("try {")
+    block_stack.append(BlockFrame("try"))
+    return True
+
+
+def line_catch(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = CATCH_PATTERN.match(s)
+    if not m:
+        return False
+    out_lines.append(f"}} catch ({m.group(1)}) {{")
+    block_stack.pop()
+    block_stack.append(BlockFrame("catch"))
+    return True
+
+
+def line_forever(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    if s != "forever":
+        return False
+    out_lines.append("while(1) {")
+    block_stack.append(BlockFrame("forever"))
+    return True
+
+
+def line_repeat(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = REPEAT_PATTERN.match(s)
+    if not m:
+        return False
+    out_lines.append(f"for(int _=0; _<{m.group(1)}; _++) {{")
+    block_stack.append(BlockFrame("repeat"))
+    return True
+
+
+# pforeach and prepeat bodies become lambdas run by std/parallel's thread pool
+def line_pforeach(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = PFOREACH_PATTERN.match(s)
+    if not m:
+        return False
+    var, container, reduction, acc = m.groups()
+    m_range = ".." in container and RANGE_EXPR_PATTERN.match(container)
+    if m_range:
+        first, last, step = m_range.groups()
+        container = f"__pypp_range({first}, {last}, {step or 1})"
+    if reduction:
+        out_lines.append(f"parallel_reduce_{reduction}({container}, {acc}, [&](auto &&{var}, auto &{acc}) {{")
+    else:
+        out_lines.append(f"parallel_for_each({container}, [&](auto &&{var}) {{")
+    block_stack.append(BlockFrame("pforeach", close="});"))
+    return True
+
+
+def line_prepeat(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = PREPEAT_PATTERN.match(s)
+    if not m:
+        return False
+    out_lines.append(f"parallel_repeat({m.group(1)}, [&](long long _) {{")
+    block_stack.append(BlockFrame("prepeat", close="});"))
+    return True
+
+
+def line_bench(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = BENCH_PATTERN.match(s)
+    if not m:
+        return False
+    name, runs = m.groups()
+    out_lines.append(f"bench_run({name}, {runs}, [&]() {{")
+    block_stack.append(BlockFrame("bench", close="});"))
+    return True
+
+
+def line_cls(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    m = CLS_PATTERN.match(s)
+    if not m:
+        return False
+    out_lines.append(f"class {m.group(1)} {{")
+    block_stack.append(BlockFrame("cls", close="};"))
+    return True
+
+
+def line_print(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    if not s.startswith("print("):
+        return False
+    inside = s[s.find("(") + 1 : s.rfind(")")]
+    args = split_(inside)
+    out_lines.append("__pypp_io::out << " + " << ".join(args) + ";")
+    return True
+
+
+def assert_temp(s: str, block_stack: List[BlockFrame]) -> str:
+    # numbered per output file, so it is unique there and identical sources still
+    # give identical C++ (see OutputCache)
+    return content_hash(f"{next(temps_of(block_stack))}:{s}")[:32]
+
+
+def temps_of(block_stack: List[BlockFrame]) -> Iterator[int]:
+    root = block_stack[0]
+    if root.temps is None:
+        root.temps = count()
+    return root.temps
+
+
+def line_assert(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    if not s.startswith("assert:"):
+        return False
+    args = s[7:].split("@@@")
+    statement = args[0].strip()
+    message = args[1].strip() if len(args) > 1 else ""
+    tmp = assert_temp(s, block_stack)
+    out_lines.append(f"bool ___{tmp} = ({statement});")
+    cmsg = message.strip(' "\'')
+    out_lines.append(f"if (!___{tmp}) {{")
+    out_lines.append(
+        f"std::cout << \"Assertion failed:\\n    {statement}\\nError: {cmsg}\\nResult: \" << ___{tmp} << std::endl;"
+    )
+    out_lines.append("    std::exit(1);")
+    out_lines.append("}")
+    return True
+
+
+def line_assert_fix(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    if not s.startswith("assert_fix:"):
+        return False
+    args = s[11:].split("=>")
+    statement = args[0].strip()
+    fix = args[1].strip()
+    tmp = assert_temp(s, block_stack)
+    out_lines.append(f"bool ___{tmp} = ({statement});")
+    out_lines.append(f"if (!___{tmp}) {{")
+    out_lines.append(f"    {fix};")
+    out_lines.append("}")
+    return True
+
+
+def line_input(s: str, out_lines: List[str], block_stack: List[BlockFrame]) -> bool:
+    if not (s.startswith("input(") or s.startswith("numinput(")):
+        return False
+    numeric = s.startswith("numinput")
+    inside = s[s.find("(") + 1 : s.rfind(")")]
+    parts = split_(inside)
+    if len(parts) >= 2:
+        var_name = parts[1]
+        prompt = parts[0]
+        # the helpers live in the prelude; --fast-io swaps their implementation
+        out_lines.append(f"std::cout << {prompt};")
+        out_lines.append("__pypp_io::before_input();")
+        if numeric:
+            out_lines.append(f"__pypp_io::numinput({var_name});")
+        else:
+            out_lines.append(f"__pypp_io::line({var_name});")
+    return True
+
+
+LINE_HANDLERS = {
+    "foreach": line_foreach,
+    "return": line_return_tuple,
+    "lam": line_lambda,
+    "while": line_while,
+    "fn": line_funcdef,
+    "const": line_funcdef,
+    "if": line_if,
+    "elif": line_if,
+    "else": line_else,
+    "try": line_try,
+    "catch": line_catch,
+    "forever": line_forever,
+    "repeat": line_repeat,
+    "pforeach": line_pforeach,
+    "prepeat": line_prepeat,
+    "bench": line_bench,
+    "cls": line_cls,
+    "print": line_print,
+    "assert": line_assert,
+    "assert_fix": line_assert_fix,
+    "input": line_input,
+    "numinput": line_input,
+}
+
+
+def close_blocks(out_lines: List[str], block_stack: List[BlockFrame]):
+    while len(block_stack) > 1:
+        frame = block_stack.pop()
+        out_lines.append(frame.close)
+        print(f"WARNING: closing unclosed {frame.kind} block")
+
+
+def transpile_line(line: str, out_lines: List[str], block_stack: List[BlockFrame]):
+    s = line.strip()
+    if not s:
+        return
+
+    # Check if the original line contains a vector comprehension
+    vec_match = "foreach" in line and VEC_COMP_PATTERN.search(line)
+    if vec_match:
+        full_type = vec_match.group(1)  # Full type like std::vector<T> (can be None)
+        varname = vec_match.group(2)  # Variable name
+        expr = vec_match.group(3)  # Expression to evaluate
+        foreach_var = vec_match.group(4)  # Loop variable
+        container = vec_match.group(5)  # Container to iterate over
+        cond = vec_match.group(6)  # Optional `if` filter
+
+        if full_type:
+            out_lines.append(f"{full_type.strip()} {varname} = {{}};")
+        else:
+            out_lines.append(f"{varname} = {{}};")
+        out_lines.extend(comprehension_loop(varname, expr, foreach_var, container, cond))
+        return
+
+    if "%>" in s:
+        s = s.split("%>", 1)[0].strip()
+        if not s:
+            return
+
+    if s == "end":
+        if len(block_stack) > 1:
+            out_lines.append(block_stack.pop().close)
+        return
+
+    # each § segment is transpiled on its own, with its own block stack
+    if "§" in s:
+        segments = split_(s, "§")
+        if len(segments) > 1:
+            for segment in segments:
+                segment_out: List[str] = []
+                segment_stack = [BlockFrame("root", temps=temps_of(block_stack))]
+                transpile_line(segment, segment_out, segment_stack)
+                close_blocks(segment_out, segment_stack)
+                out_lines.append("\n".join(segment_out).strip())
+            return
+
+    keyword = KEYWORD_PATTERN.match(s)
+    handler = keyword and LINE_HANDLERS.get(keyword.group())
+    if handler and handler(s, out_lines, block_stack):
+        return
+
+    if not s.endswith((";", "{", "}", ">", ",")) and not s.startswith("#"):
+        s += ";"
+    out_lines.append(s)
+
+
 # ---------------------------------------------------------------------------
 #  MAIN TRANSPILER
 # ---------------------------------------------------------------------------
 
 
-def transpile_paren_blocks_to_cpp(source: str, original: bool = True) -> str:
-    source = (
-        """
+# helpers every generated program gets, in Py++ source form
+PRELUDE_SOURCE = """
 fn sstoi(std::string s) int
     try
         return std::stoi(s)
@@ -573,220 +2203,1651 @@ fn sstoi(std::string s) int
     end
 end
 """
-        + source
-    ) if original else source
-    lines = expand_ranges_outside_strings(source).splitlines()
-
-    out_lines: List[str] = [
-        "#include <iostream>",
-        "#include <cstdint>",
-        "#include <cstdlib>",
-        "#include <limits>",
-        "#include <string>",
-        "#include <vector>",
-        "#include <cstring>",
-        """#if __cplusplus >= 201703L
+
+# guarded, so a precompiled copy passed with -include makes the inline one a no-op
+PRELUDE_CPP: List[str] = [
+    "#ifndef __PYPP_PRELUDE__",
+    "#define __PYPP_PRELUDE__",
+    "#include <iostream>",
+    "#include <cstdint>",
+    "#include <cstdlib>",
+    "#include <limits>",
+    "#include <string>",
+    "#include <vector>",
+    "#include <cstring>",
+    "#include <utility>",
+    "#include <iterator>",
+    "#include <type_traits>",
+    """#if __cplusplus >= 201703L
     #include <filesystem>
     namespace fs = std::filesystem;
 #else
     #include <experimental/filesystem>
     namespace fs = std::experimental::filesystem;
 #endif""",
-        "#define __THIS__ fs::path(__argv[0])",
-    ] if original else []
-
-    block_stack: List[BlockFrame] = [BlockFrame("root")]
-
-    i = 0
-    while i < len(lines):
-        s = lines[i].strip()
-        i += 1
-        if not s:
-            continue
+    "#define __THIS__ fs::path(__argv[0])",
+    """struct __pypp_range {
+    struct iterator {
+        int value, step;
+        long long index;
+        const int &operator*() const { return value; }
+        iterator &operator++() { value += step; ++index; return *this; }
+        bool operator!=(const iterator &o) const { return index != o.index; }
+    };
+    int first, step;
+    long long count;
+    __pypp_range(int a, int b, int s)
+        : first(a), step(s), count((s > 0 ? a <= b : a >= b) ? ((long long)b - a) / s + 1 : 0) {}
+    iterator begin() const { return {first, step, 0}; }
+    iterator end() const { return {first, step, count}; }
+    std::size_t size() const { return count; }
+    int operator[](std::size_t i) const { return first + (int)i * step; }
+    operator std::vector<int>() const {
+        std::vector<int> v;
+        v.reserve(count);
+        for (int x : *this) v.push_back(x);
+        return v;
+    }
+    template <class C, class = decltype(std::declval<C &>().insert(std::declval<C &>().end(), 0))>
+    operator C() const {
+        C c;
+        for (int x : *this) c.insert(c.end(), x);
+        return c;
+    }
+};""",
+    """// comprehension helpers: reserve when both sides allow it, move out of temporaries
+template <class V, class C>
+inline auto __pypp_reserve(V &v, const C &c, int) -> decltype(v.reserve(std::size(c))) {
+    v.reserve(std::size(c));
+}
+template <class V, class C>
+inline void __pypp_reserve(V &, const C &, long) {}
+template <class V>
+inline auto __pypp_reserve_n(V &v, std::size_t n, int) -> decltype(v.reserve(n)) {
+    v.reserve(n);
+}
+template <class V>
+inline void __pypp_reserve_n(V &, std::size_t, long) {}
+template <class Src, class T>
+inline decltype(auto) __pypp_take(T &x) {
+    if constexpr (std::is_rvalue_reference_v<Src>) return std::move(x);
+    else return x;
+}""",
+    """namespace __pypp_io {
+#ifndef PYPP_FAST_IO
+inline std::ostream &out = std::cout;
+inline void before_input() { std::cout << std::flush; }
+template <class T>
+inline void numinput(T &out) {
+    std::cin >> out;
+    std::cin.ignore(std::numeric_limits<std::streamsize>::max(), '\\n');
+}
+inline void line(std::string &out) { std::getline(std::cin, out); }
+#else
+}
+#include <cctype>
+#include <charconv>
+#include <cstdio>
+#include <type_traits>
+#ifdef _WIN32
+#include <io.h>
+#define __PYPP_ISATTY _isatty
+#else
+#include <unistd.h>
+#define __PYPP_ISATTY isatty
+#endif
+namespace __pypp_io {
+// stdin is read a line at a time into a large buffer (fgets returns after each
+// line, so interactive input still works); std::cout is unsynced and buffered,
+// flushed at exit and before input when stdin is a terminal
+struct state {
+    char in_buf[1 << 16];
+    std::size_t pos = 0, len = 0;
+    char out_buf[1 << 16];
+    bool interactive;
+    state() : interactive(__PYPP_ISATTY(0)) {
+        std::ios::sync_with_stdio(false);
+        std::cout.rdbuf()->pubsetbuf(out_buf, sizeof out_buf);
+    }
+    int peek() {
+        if (pos == len) {
+            pos = len = 0;
+            if (std::fgets(in_buf, sizeof in_buf, stdin)) len = std::strlen(in_buf);
+            if (len == 0) return EOF;
+        }
+        return (unsigned char)in_buf[pos];
+    }
+};
+inline state io;
+inline void before_input() {
+    if (io.interactive) std::cout.flush();
+}
+// print writes straight into std::cout's buffer; anything else, or any
+// formatting state other than the default, goes through operator<<
+inline bool plain() {
+    return std::cout.flags() == (std::ios_base::dec | std::ios_base::skipws)
+        && std::cout.width() == 0 && std::cout.precision() == 6;
+}
+// character types print as characters, so they stay with operator<<
+template <class U>
+inline constexpr bool is_char_v = std::is_same_v<U, char> || std::is_same_v<U, signed char>
+    || std::is_same_v<U, unsigned char> || std::is_same_v<U, wchar_t>
+    || std::is_same_v<U, char16_t> || std::is_same_v<U, char32_t>
+#ifdef __cpp_char8_t
+    || std::is_same_v<U, char8_t>
+#endif
+    ;
+template <class T>
+inline void put(const T &v) {
+    using U = std::decay_t<T>;
+    std::streambuf *sb = std::cout.rdbuf();
+    if constexpr (std::is_same_v<U, std::string>) {
+        if (std::cout.width() == 0) return (void)sb->sputn(v.data(), v.size());
+    } else if constexpr (std::is_same_v<U, const char *> || std::is_same_v<U, char *>) {
+        if (std::cout.width() == 0) return (void)sb->sputn(v, std::strlen(v));
+    } else if constexpr (std::is_integral_v<U> && !std::is_same_v<U, bool> && !is_char_v<U>) {
+        if (plain()) {
+            char buf[24];
+            return (void)sb->sputn(buf, std::to_chars(buf, buf + sizeof buf, v).ptr - buf);
+        }
+#if defined(__cpp_lib_to_chars) && __cpp_lib_to_chars >= 201611L
+    } else if constexpr (std::is_floating_point_v<U>) {
+        if (plain()) {
+            char buf[32];
+            auto r = std::to_chars(buf, buf + sizeof buf, v, std::chars_format::general, 6);
+            return (void)sb->sputn(buf, r.ptr - buf);
+        }
+#endif
+    }
+    std::cout << v;
+}
+struct writer {
+    template <class T>
+    writer &operator<<(const T &v) { put(v); return *this; }
+    writer &operator<<(std::ostream &(*manip)(std::ostream &)) { manip(std::cout); return *this; }
+};
+inline writer out;
+template <class T>
+inline void numinput(T &out) {
+    int c = io.peek();
+    while (c != EOF && std::isspace(c)) { ++io.pos; c = io.peek(); }
+    char tok[128];
+    std::size_t n = 0;
+    while (c != EOF && !std::isspace(c) && n < sizeof tok - 1) { tok[n++] = (char)c; ++io.pos; c = io.peek(); }
+    tok[n] = 0;
+    const char *first = tok[0] == '+' ? tok + 1 : tok;
+    if constexpr (std::is_same_v<T, bool>) {
+        int v = 0;
+        std::from_chars(first, tok + n, v);
+        out = v != 0;
+    } else if constexpr (std::is_integral_v<T>) {
+        out = T{};
+        std::from_chars(first, tok + n, out);
+    } else {
+        out = (T)std::strtod(tok, nullptr);
+    }
+    while (c != EOF && c != '\\n') { ++io.pos; c = io.peek(); }  // rest of the line
+    if (c == '\\n') ++io.pos;
+}
+inline void line(std::string &out) {
+    out.clear();
+    for (int c = io.peek(); c != EOF; c = io.peek()) {
+        ++io.pos;
+        if (c == '\\n') break;
+        out += (char)c;
+    }
+}
+#endif
+}""",
+    """#ifdef PYPP_INSTRUMENT
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <map>
+#include <mutex>
+namespace __pypp_prof {
+// one per instrumented function (a static local); trivially destructible, so
+// the counters are still there when the report runs at exit
+struct site {
+    const char *name;
+    std::size_t id;
+    std::atomic<unsigned long long> calls{0}, total{0}, self{0};
+    explicit site(const char *name);
+};
+inline std::vector<site *> &sites() {
+    static std::vector<site *> all;
+    return all;
+}
+inline unsigned long long now() {
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+struct scope;
+inline thread_local scope *current = nullptr;
+// open scopes of each site on this thread: recursion adds to total only once
+inline thread_local std::vector<unsigned> depth;
+struct scope {
+    site &at;
+    scope *parent;
+    unsigned long long start, nested = 0;
+    explicit scope(site &s) : at(s), parent(current) {
+        if (depth.size() <= s.id) depth.resize(s.id + 1);
+        ++depth[s.id];
+        current = this;
+        start = now();
+    }
+    ~scope() {
+        unsigned long long elapsed = now() - start;
+        at.calls.fetch_add(1, std::memory_order_relaxed);
+        at.self.fetch_add(elapsed - nested, std::memory_order_relaxed);
+        if (--depth[at.id] == 0) at.total.fetch_add(elapsed, std::memory_order_relaxed);
+        if (parent) parent->nested += elapsed;
+        current = parent;
+    }
+};
+inline void report() {
+    struct row { unsigned long long calls = 0, total = 0, self = 0; };
+    std::map<std::string, row> by_name;  // template instantiations share a name
+    unsigned long long all_self = 0;
+    for (site *s : sites()) {
+        row &r = by_name[s->name];
+        r.calls += s->calls;
+        r.total += s->total;
+        r.self += s->self;
+        all_self += s->self;
+    }
+    std::vector<std::pair<std::string, row>> rows(by_name.begin(), by_name.end());
+    std::sort(rows.begin(), rows.end(), [](const auto &a, const auto &b) {
+        if (a.second.self != b.second.self) return a.second.self > b.second.self;
+        if (a.second.total != b.second.total) return a.second.total > b.second.total;
+        return a.second.calls > b.second.calls;
+    });
+    std::fflush(stdout);
+    std::fprintf(stderr, "\\n[Py++] profile, by self time\\n%12s %12s %12s %7s  %s\\n",
+                 "calls", "total ms", "self ms", "self %", "function");
+    for (const auto &[name, r] : rows) {
+        if (r.calls == 0) continue;
+        std::fprintf(stderr, "%12llu %12.3f %12.3f %6.1f%%  %s\\n", r.calls, r.total / 1e6,
+                     r.self / 1e6, all_self ? 100.0 * r.self / all_self : 0.0, name.c_str());
+    }
+}
+inline site::site(const char *name) : name(name) {
+    static std::mutex registering;
+    std::lock_guard<std::mutex> lock(registering);
+    id = sites().size();
+    sites().push_back(this);
+    if (id == 0) std::atexit(report);
+}
+}
+#endif""",
+    "#endif",
+]
 
-        # Check if the original line contains a vector comprehension
-        vec_comp_pattern = r"((?:std::vector<[^>]+>|std::vector<std::string>)\s+)?(\w+)\s*=\s*\((.+?)\s+foreach\s+(\w+)\s+(.+?)\)"
-        vec_match = re.search(vec_comp_pattern, lines[i - 1])
-        if vec_match:
-            full_type = vec_match.group(
-                1
-            )  # Full type like std::vector<T> (can be None)
-            varname = vec_match.group(2)  # Variable name
-            expr = vec_match.group(3)  # Expression to evaluate
-            foreach_var = vec_match.group(4)  # Loop variable
-            container = vec_match.group(5)  # Container to iterate over
-
-            if full_type:
-                out_lines.append(f"{full_type.strip()} {varname} = {{}};")
-            else:
-                out_lines.append(f"{varname} = {{}};")
 
-            out_lines.append(f"for (auto &{foreach_var} : {container}) {{")
-            out_lines.append(f"    {varname}.push_back({expr});")
-            out_lines.append("}")
-            continue  # Skip the rest of processing for this line
+INSTRUMENT_SCOPE = (
+    'static __pypp_prof::site __pypp_site("{name}"); '
+    "__pypp_prof::scope __pypp_scope(__pypp_site);"
+)
 
-        if "%>" in s:
-            s = s.split("%>", 1)[0].strip()
-            if not s:
-                continue
 
-        if s == "end":
-            if len(block_stack) > 1:
-                is_cls = block_stack.pop() == "cls"
-                out_lines.append("};" if is_cls else "}")
-            continue
+def builtin_module_ids(root: str) -> Set[str]:
+    """module_id of each built-in module, were it installed in the search directory `root`."""
+    base = os.path.dirname(os.path.abspath(root))
+    return {module_id(os.path.join(base, rel)) for rel in BUILTIN_MODULES}
 
-        m_if = re.match(r"^(if|elif)\s+(.*)$", s)
-        m_else = re.match(r"^else$", s)
-        m_cls = re.match(r"^cls\s([a-zA-Z0-9_]+)$", s)
-        m_repeat = re.match(r"^repeat\s+(.+?)$", s)
-        m_while = re.match(r"^while\s+(.*)$", s)
-        m_try = re.match(r"^try$", s)
-        m_catch = re.match(r"^catch\s+(.*)$", s)
-        m_foreach = re.match(r"^foreach\s+(\w+)\s+(.*)$", s)
-        m_forever = re.match(r"^forever$", s)
-        m_funcdef = re.match(
-            r"^(?:(const)\s+)?fn\s+([a-zA-Z0-9_]\w*)\s*\((.*)\)\s*(.*?)?$", s
-        )
-        m_lambda = re.match(r"lam:\s*([a-zA-Z0-9_]\w*)\s*\((.*)\)\s+=>\s+(.*?)$", s)
-        m_return_tuple = re.match(r"^return\s+([a-zA-Z0-9_,\s]+]);$", s)
 
-        semicolon_split = split_(s, "§")
-        if len(semicolon_split) > 1:
-            for ssl in semicolon_split:
-                out_lines.append(transpile_paren_blocks_to_cpp(ssl, original=False).strip())
-            continue
+def instrument_functions(source: str, skip: Collection[str] = ()) -> str:
+    """Open a profiling scope at the top of every `fn` body (--instrument).
 
-        if m_foreach:
-            var, arr = m_foreach.groups()
-            if ".." in arr:
-                arr = (
-                    "{"
-                    + ",".join(
-                        str(i)
-                        for i in range(int(arr.split("..")[0]), int(arr.split("..")[1]))
-                    )
-                    + "}"
-                )
-            out_lines.append(f"for (auto &{var} : {arr}) {{")
-            block_stack.append(BlockFrame("foreach"))
-            continue
-        elif m_return_tuple:
-            out_lines.append(f"return std::make_tuple({m_return_tuple.group(1)});")
+    Scopes are named as the function is written in Py++: `random.randint`
+    rather than the renamed `random_randint`. Functions of the modules in
+    `skip` (the built-in ones, such as the bench helpers) are left alone.
+    """
+    out: List[str] = []
+    modules: List[str] = []  # innermost module being read last
+    for line in source.splitlines():
+        out.append(line)
+        if line.startswith(MODULE_BEGIN):
+            modules.append(line[len(MODULE_BEGIN):])
             continue
-        elif m_lambda:
-            name, args, body = m_lambda.groups()
-            out_lines.append(f"auto {name} = [&]({args}) {{return {body};}};")
+        if line.startswith(MODULE_END):
+            modules.pop()
             continue
-        elif m_while:
-            cond = m_while.group(1)
-            out_lines.append(f"while ({cond}) {{")
-            block_stack.append(BlockFrame("while"))
+        if modules and modules[-1] in skip:
             continue
-        elif m_funcdef:
-            const = m_funcdef.group(1)
-            name = m_funcdef.group(2)
-            args = m_funcdef.group(3)
-            rettype = m_funcdef.group(4)
-            
-            const_prefix = "const " if const else ""
-            out_lines.append(f"{const_prefix}{rettype or 'void'} {name}({args}) {{")
-            block_stack.append(BlockFrame("funcdef"))
-            continue  # Don't add the original line again
-        elif m_if:
-            kw, cond = m_if.groups()
-            out_lines.append(f"{'if' if kw == 'if' else '} else if'} ({cond}) {{")
-            if kw == "elif":
-                block_stack.pop()
-            block_stack.append(BlockFrame(kw))
+        m = FUNCDEF_PATTERN.match(line.strip())
+        if not m:
             continue
-        elif m_else:
-            out_lines.append("} else {")
-            block_stack.pop()
-            block_stack.append(BlockFrame("else"))
+        name = m.group(2)
+        module = modules[-1].rsplit("-", 1)[0] if modules else None
+        if module and name.startswith(module + "_"):
+            name = f"{module}.{name[len(module) + 1:]}"
+        out.append(INSTRUMENT_SCOPE.format(name=name))
+    return "\n".join(out)
+
+
+def transpile_paren_blocks_to_cpp(source: str, original: bool = True) -> str:
+    source = PRELUDE_SOURCE + source if original else source
+    with phase("expand_ranges"):
+        lines = expand_ranges_outside_strings(source).splitlines()
+    return "\n".join(transpile_lines(lines, original))
+
+
+def transpile_lines(lines: Iterable[str], original: bool = True) -> Iterator[str]:
+    """The C++ lines for range-expanded Py++ `lines`, each yielded once it is known."""
+    if original:
+        yield from PRELUDE_CPP
+
+    out_lines: List[str] = []
+    block_stack: List[BlockFrame] = [BlockFrame("root", temps=count())]
+    for line in lines:
+        transpile_line(line, out_lines, block_stack)
+        if out_lines:
+            yield from out_lines
+            out_lines.clear()
+    close_blocks(out_lines, block_stack)
+    yield from out_lines
+
+
+def stream_cpp(source: str) -> Iterator[str]:
+    """transpile_paren_blocks_to_cpp as a pipeline of lines (--stream).
+
+    Joined with newlines the lines are the same text, but no stage holds more
+    than a few lines of it, so the output can be written as it is made.
+    """
+    lines = expand_ranges_lines(
+        line for text in (PRELUDE_SOURCE, source) for line in iter_lines(text)
+    )
+    return transpile_lines(lines)
+
+
+def write_lines(lines: Iterable[str], out: TextIO, digest: Optional[Any] = None) -> int:
+    """Write `lines` to `out` as "\\n".join would, hashing them into `digest` if given.
+
+    Lines are written a batch at a time; returns the number of lines.
+    """
+    lines = iter(lines)
+    count = 0
+    while True:
+        batch = list(islice(lines, 1024))
+        if not batch:
+            return count
+        text = "\n".join(batch)
+        if count:
+            text = "\n" + text
+        out.write(text)
+        if digest is not None:
+            digest.update(text.encode("utf-8"))
+        count += len(batch)
+
+
+# ---------------------------------------------------------------------------
+#  Tree shaking: drop module functions and globals that main cannot reach
+# ---------------------------------------------------------------------------
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_]\w*")
+# a global whose line ends like this goes on below, so it is never dropped
+CONTINUED_LINE = (",", "{", "(", "[", "=", "\\")
+LITERAL_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+# calls (and constructors), increments, assignments: initializers that do something
+SIDE_EFFECT_PATTERN = re.compile(r"[\w>)\]}]\s*\(|\+\+|--|(?<![=!<>])=(?!=)|\b(?:new|delete|throw)\b")
+
+
+class ShakeItem:
+    """A top-level function or global of an imported module: source lines [start, end)."""
+
+    def __init__(self, module: str, name: str, start: int, function: bool):
+        self.module = module
+        self.name = name
+        self.function = function
+        self.start = start
+        self.end = start + 1
+        self.cpp_lines = 0
+        self.uses: Set[str] = set()  # identifiers in its code
+
+    def add(self, code: str, out: List[str]):
+        self.uses.update(identifiers(code, out))
+        self.cpp_lines += len(out)
+
+
+def identifiers(code: str, out: List[str]) -> Set[str]:
+    """Names used by a line: lowered constructs like pforeach only name theirs in the C++."""
+    return set(IDENTIFIER_PATTERN.findall(code)).union(*(IDENTIFIER_PATTERN.findall(o) for o in out))
+
+
+def constant_initializer(init: Optional[str]) -> bool:
+    """Whether a global's `= ...` (if any) can be left out without changing what the program does."""
+    if not init:
+        return True
+    return not SIDE_EFFECT_PATTERN.search(LITERAL_PATTERN.sub('""', init.lstrip("=")))
+
+
+def shake_items(lines: List[str]) -> Tuple[List[ShakeItem], Set[str]]:
+    """The droppable items in loader output, and the identifiers used by everything else.
+
+    Only functions and single-line globals at the top level of an imported
+    module can be dropped, and globals only if their initializer has no side
+    effects. The main file, structs, classes, includes and any
+    other top-level code are kept, and whatever they name is reachable.
+    Blocks are followed with the line transpiler itself, so a function ends
+    exactly where its C++ body does.
+    """
+    items: List[ShakeItem] = []
+    roots: Set[str] = set()
+    modules: List[str] = []  # innermost module being read last
+    block_stack: List[BlockFrame] = [BlockFrame("root")]
+    item: Optional[ShakeItem] = None  # the function being read
+    template: Optional[Tuple[int, str, List[str]]] = None  # a template line waiting for its fn
+    raw_depth = 0  # braces still open in a C++ struct or class
+    for i, line in enumerate(lines):
+        if line.startswith(MODULE_BEGIN):
+            modules.append(line[len(MODULE_BEGIN):])
             continue
-        elif m_try:
-            out_lines.append("try {")
-            block_stack.append(BlockFrame("try"))
+        if line.startswith(MODULE_END):
+            modules.pop()
             continue
-        elif m_catch:
-            exception = m_catch.group(1)
-            out_lines.append(f"}} catch ({exception}) {{")
-            block_stack.pop()
-            block_stack.append(BlockFrame("catch"))
+        code = line.split("%>", 1)[0]
+        top_level = len(block_stack) == 1 and not raw_depth
+        out: List[str] = []
+        transpile_line(line, out, block_stack)
+
+        if item is not None:
+            item.add(code, out)
+            if len(block_stack) == 1:
+                item.end = i + 1
+                item = None
             continue
-        elif m_forever:
-            out_lines.append("while(1) {")
-            block_stack.append(BlockFrame("forever"))
+        s = code.strip()
+        if raw_depth:
+            raw_depth += brace_delta("\n".join(out))
+        elif modules and top_level and s:
+            func = FUNCDEF_PATTERN.match(s)
+            glob = GLOBAL_PATTERN.match(s)
+            if func and len(block_stack) == 2:
+                new = ShakeItem(modules[-1], func.group(2), template[0] if template else i, True)
+                if template:
+                    new.add(template[1], template[2])
+                    template = None
+                new.add(code, out)
+                items.append(new)
+                item = new
+                continue
+            if template:
+                roots.update(identifiers(template[1], template[2]))
+                template = None
+            if TEMPLATE_PATTERN.match(s):
+                template = (i, code, out)
+                continue
+            if glob and not s.endswith(CONTINUED_LINE) and constant_initializer(glob.group(4)):
+                new = ShakeItem(modules[-1], glob.group(2), i, False)
+                new.add(code, out)
+                items.append(new)
+                continue
+            if RAW_TYPE_PATTERN.match(s):
+                raw_depth = brace_delta(s)
+        roots.update(identifiers(code, out))
+    if template:
+        roots.update(identifiers(template[1], template[2]))
+    return items, roots
+
+
+def tree_shake(source: str, keep: List[str] = ()) -> str:
+    """Drop the functions and globals of imported modules that nothing kept refers to (--shake).
+
+    Reachability starts from the main file and every other line that is
+    kept (see shake_items), plus the `keep` symbols, written either as
+    `module.name` or as the renamed `module_name`. Identifiers are matched by
+    name, so overloads live or die together, and a name merely appearing in
+    a string keeps its function. What was removed is reported per module.
+    """
+    lines = source.splitlines()
+    items, roots = shake_items(lines)
+    by_name: Dict[str, List[ShakeItem]] = {}
+    for item in items:
+        by_name.setdefault(item.name, []).append(item)
+
+    pending = [name for name in roots | {k.replace(".", "_") for k in keep} if name in by_name]
+    reached: Set[str] = set()
+    while pending:
+        name = pending.pop()
+        if name in reached:
             continue
-        elif m_repeat:
-            count = m_repeat.group(1)
-            out_lines.append(f"for(int _=0; _<{count}; _++) {{")
-            block_stack.append(BlockFrame("repeat"))
+        reached.add(name)
+        for item in by_name[name]:
+            pending.extend(used for used in item.uses if used in by_name and used not in reached)
+
+    dropped = [item for item in items if item.name not in reached]
+    if not dropped:
+        return source
+    for item in dropped:
+        lines[item.start:item.end] = [None] * (item.end - item.start)
+
+    functions = sum(1 for item in items if item.function)
+    dropped_functions = sum(1 for item in dropped if item.function)
+    print(
+        f"[Py++] tree shaking removed {dropped_functions} of {functions} functions and"
+        f" {len(dropped) - dropped_functions} of {len(items) - functions} globals"
+        f" ({sum(item.end - item.start for item in dropped)} Py++ lines,"
+        f" {sum(item.cpp_lines for item in dropped)} lines of C++):"
+    )
+    by_module: Dict[str, List[str]] = {}
+    for item in dropped:
+        module = item.module.rsplit("-", 1)[0]
+        name = item.name[len(module) + 1:] if item.name.startswith(module + "_") else item.name
+        if name not in by_module.setdefault(module, []):
+            by_module[module].append(name)
+    for module, names in by_module.items():
+        print(f"  {module}: {', '.join(names)}")
+    if PHASE_STATS:
+        PHASE_STATS.lines["removed"] = sum(item.cpp_lines for item in dropped)
+    return "\n".join(line for line in lines if line is not None)
+
+
+# ---------------------------------------------------------------------------
+#  Separate compilation: one translation unit per imported module
+# ---------------------------------------------------------------------------
+
+BUILD_DIR = ".pypp-build"
+PRELUDE_HEADER = "pypp_prelude.h"
+
+TEMPLATE_PATTERN = re.compile(r"^template\s*<")
+CONDITIONAL_PATTERN = re.compile(r"^#\s*(if|ifdef|ifndef|elif|else|endif)\b")
+RAW_TYPE_PATTERN = re.compile(r"^(?:struct|class|union|enum)\b[^;]*\{$")
+CONDITIONAL_DEPTH = {"if": 1, "ifdef": 1, "ifndef": 1, "endif": -1}
+
+
+class ModuleUnit:
+    def __init__(self, name: str):
+        self.name = name
+        self.lines: List[str] = []
+        self.imports: List[str] = []
+
+
+def split_units(src: str) -> List[ModuleUnit]:
+    """Split loader output back into the main file and one unit per imported module."""
+    main = ModuleUnit("main")
+    units = [main]
+    stack = [main]
+    for line in src.splitlines():
+        if line.startswith(MODULE_BEGIN):
+            unit = ModuleUnit(line[len(MODULE_BEGIN):])
+            stack[-1].imports.append(unit.name)
+            units.append(unit)
+            stack.append(unit)
+        elif line.startswith(MODULE_END):
+            stack.pop()
+        elif line.startswith(MODULE_USES):
+            stack[-1].imports.append(line[len(MODULE_USES):])
+        else:
+            stack[-1].lines.append(line)
+    return units
+
+
+def strip_default_args(args: str) -> str:
+    """Drop `= value` defaults from a parameter list; they belong in the header only."""
+    params = []
+    depth = 0
+    in_str = False
+    current = ""
+    skipping = False
+    for i, c in enumerate(args):
+        if c in "\"'" and (i == 0 or args[i - 1] != "\\"):
+            in_str = not in_str
+        elif not in_str:
+            if c in "(<[{":
+                depth += 1
+            elif c in ")>]}":
+                depth -= 1
+            elif c == "," and depth == 0:
+                params.append(current.strip())
+                current = ""
+                skipping = False
+                continue
+            elif c == "=" and depth == 0:
+                skipping = True
+        if not skipping:
+            current += c
+    if current.strip():
+        params.append(current.strip())
+    return ", ".join(params)
+
+
+def brace_delta(code: str) -> int:
+    return code.count("{") - code.count("}")
+
+
+def unit_cpp(unit: ModuleUnit) -> Optional[Tuple[str, str]]:
+    """Transpile a module unit into (header, source), or None if it cannot be split.
+
+    Memoized, so a resident process (see watch) only transpiles the modules that changed.
+    """
+    return _unit_cpp(unit.name, tuple(unit.imports), "\n".join(unit.lines))
+
+
+@lru_cache(maxsize=256)
+def _unit_cpp(name: str, imports: Tuple[str, ...], text: str) -> Optional[Tuple[str, str]]:
+    header = ["#pragma once", f'#include "{PRELUDE_HEADER}"']
+    header += [f'#include "{dep}.h"' for dep in imports]
+    source = [f'#include "{name}.h"']
+
+    block_stack: List[BlockFrame] = [BlockFrame("root", temps=count())]
+    target = source
+    template_pending = False
+    raw_depth = 0  # braces still open in a C++ struct or class
+    conditional_depth = 0
+    with phase("expand_ranges"):
+        lines = expand_ranges_outside_strings(text).splitlines()
+    for line in lines:
+        top_level = len(block_stack) == 1
+        out: List[str] = []
+        transpile_line(line, out, block_stack)
+        if raw_depth:
+            header.extend(out)
+            raw_depth += brace_delta("\n".join(out))
             continue
-        elif m_cls:
-            name = m_cls.group(1)
-            out_lines.append(f"class {name} {{")
-            block_stack.append(BlockFrame("cls"))
+        if not top_level:
+            target.extend(out)
             continue
 
-        if s.startswith("print("):
-            inside = s[s.find("(") + 1 : s.rfind(")")]
-            args = split_(inside)
-            out_lines.append("std::cout << " + " << ".join(args) + ";")
+        s = line.split("%>", 1)[0].strip()
+        if not s or s.startswith("//"):
             continue
-    
-        if s.startswith("assert:"):
-            args = s[7:].split("@@@")
-            statement = args[0].strip()
-            message = args[1].strip() if len(args) > 1 else ""
-            tmp = str(uuid.uuid4()).replace("-", "")
-            out_lines.append(f"bool ___{tmp} = ({statement});")
-            cmsg = message.strip(' "\'')
-            out_lines.append(f"if (!___{tmp}) {{")
-            out_lines.append(
-                    f"std::cout << \"Assertion failed:\\n    {statement}\\nError: {cmsg}\\nResult: \" << ___{tmp} << std::endl;"
+
+        func = FUNCDEF_PATTERN.match(s)
+        glob = GLOBAL_PATTERN.match(s)
+        conditional = CONDITIONAL_PATTERN.match(s)
+        if conditional:
+            conditional_depth += CONDITIONAL_DEPTH.get(conditional.group(1), 0)
+            target = header
+        elif RAW_TYPE_PATTERN.match(s):
+            raw_depth = brace_delta(s)
+            target = header
+        elif s.startswith("#") or s.startswith("using ") or TEMPLATE_PATTERN.match(s):
+            template_pending = bool(TEMPLATE_PATTERN.match(s))
+            target = header
+        elif func and not template_pending:
+            const, name, args, rettype = func.groups()
+            const_prefix = "const " if const else ""
+            header.append(f"{const_prefix}{rettype or 'void'} {name}({args});")
+            out[0] = f"{const_prefix}{rettype or 'void'} {name}({strip_default_args(args)}) {{"
+            target = source
+        elif func or CLS_PATTERN.match(s):
+            template_pending = False
+            target = header
+        elif glob and glob.group(1) != "auto":
+            if s.startswith("const "):
+                target = header
+            else:
+                header.append(f"extern {glob.group(1)} {glob.group(2)};")
+                target = source
+        else:
+            print(f"[Py++] cannot split {name}: top-level '{s}'")
+            return None
+        if conditional_depth and target is not header:
+            print(f"[Py++] cannot split {name}: '{s}' inside a preprocessor conditional")
+            return None
+        target.extend(out)
+    close_blocks(target, block_stack)
+
+    return "\n".join(header), "\n".join(source)
+
+
+def run_gpp(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["g++"] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def pipe_to_gpp(args: List[str], lines: Iterable[str]) -> Tuple[subprocess.CompletedProcess, int]:
+    """Compile C++ `lines` fed to g++'s stdin as they are produced (--pipe).
+
+    g++ reads all of its input before it reports anything, but its output
+    goes to files anyway, so a chatty compiler can never block the writer.
+    Returns the result and the number of lines written.
+    """
+    with tempfile.TemporaryFile("w+") as out, tempfile.TemporaryFile("w+") as err:
+        proc = subprocess.Popen(
+            ["g++", "-x", "c++", "-"] + args,
+            stdin=subprocess.PIPE,
+            stdout=out,
+            stderr=err,
+            text=True,
+            encoding="utf-8",
+        )
+        count = 0
+        try:
+            count = write_lines(lines, proc.stdin)
+            proc.stdin.close()
+        except BrokenPipeError:  # g++ gave up early; its errors say why
+            pass
+        returncode = proc.wait()
+        out.seek(0)
+        err.seek(0)
+        return subprocess.CompletedProcess(proc.args, returncode, out.read(), err.read()), count
+
+
+def write_if_changed(path: str, content: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def prelude_helpers_cpp() -> str:
+    """PRELUDE_SOURCE as inline functions, so every unit of a split build can call them."""
+    out = ["#ifndef __PYPP_PRELUDE_HELPERS__", "#define __PYPP_PRELUDE_HELPERS__"]
+    block_stack: List[BlockFrame] = [BlockFrame("root", temps=count())]
+    for line in expand_ranges_outside_strings(PRELUDE_SOURCE).splitlines():
+        top_level = len(block_stack) == 1
+        lines: List[str] = []
+        transpile_line(line, lines, block_stack)
+        if top_level and len(block_stack) > 1 and block_stack[-1].kind == "funcdef":
+            lines[0] = "inline " + lines[0]
+        out.extend(lines)
+    out.append("#endif")
+    return "\n".join(out)
+
+
+def build_split(
+    src: str,
+    output: str,
+    profile: "BuildProfile",
+    pch_flags: Callable[[List[str]], List[str]],
+    build_dir: str = BUILD_DIR,
+) -> Optional[subprocess.CompletedProcess]:
+    """Compile every module to its own object in parallel, then link.
+
+    Objects are named after the hash of everything they are built from (the
+    source, the headers it can reach, the flags and the g++ version), so an
+    unchanged module reuses its object from the previous build. Each module
+    gets the profile's flags plus its own overrides; `pch_flags` gives the
+    precompiled prelude for a flag set (see prelude_pch). Returns the
+    failing g++ run or the link, or None if the program cannot be split.
+    """
+    units = split_units(src)
+    headers = {PRELUDE_HEADER: "\n".join(PRELUDE_CPP + [prelude_helpers_cpp()])}
+    sources = {}
+    with phase("transpile"):
+        for unit in units[1:]:
+            split = unit_cpp(unit)
+            if split is None:
+                return None
+            headers[f"{unit.name}.h"], sources[unit.name] = split
+
+        main = units[0]
+        sources[main.name] = "\n".join(
+            [f'#include "{PRELUDE_HEADER}"']
+            + [f'#include "{name}.h"' for name in main.imports]
+            + [transpile_paren_blocks_to_cpp("\n".join(main.lines), original=False)]
+        )
+    if PHASE_STATS:
+        generated = list(headers.values()) + list(sources.values())
+        PHASE_STATS.lines["generated"] = sum(text.count("\n") + 1 for text in generated)
+    imports = {unit.name: unit.imports for unit in units}
+
+    def reachable_headers(name: str) -> List[str]:
+        seen = []
+        pending = list(imports[name])
+        while pending:
+            dep = pending.pop()
+            if dep not in seen:
+                seen.append(dep)
+                pending.extend(imports.get(dep, ()))
+        return [headers[f"{dep}.h"] for dep in sorted(seen)]
+
+    os.makedirs(build_dir, exist_ok=True)
+    for name, text in headers.items():
+        write_if_changed(os.path.join(build_dir, name), text + "\n")
+
+    objects, jobs = [], []
+    for name, text in sources.items():
+        cpp_path = os.path.join(build_dir, f"{name}.cpp")
+        write_if_changed(cpp_path, text + "\n")
+        flags = profile.compile_flags(name.rsplit("-", 1)[0] if name != "main" else name)
+        key = content_hash(
+            "\0".join([gpp_version(), " ".join(flags), headers[PRELUDE_HEADER], text] + reachable_headers(name))
+        )
+        obj_path = os.path.join(build_dir, f"{name}-{key[:16]}.o")
+        objects.append(obj_path)
+        if not os.path.exists(obj_path):
+            # precompiled headers are built here, before the workers start
+            jobs.append((flags + pch_flags(flags), cpp_path, obj_path))
+
+    def compile_object(job: Tuple[List[str], str, str]) -> subprocess.CompletedProcess:
+        flags, cpp_path, obj_path = job
+        tmp = f"{obj_path}.{uuid.uuid4().hex}.tmp"
+        result = run_gpp(flags + ["-c", cpp_path, "-o", tmp])
+        if result.returncode == 0:
+            os.replace(tmp, obj_path)
+        return result
+
+    with phase("g++"), ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        results = list(pool.map(compile_object, jobs))
+    print(f"[Py++] compiled {len(jobs)} of {len(objects)} units ({len(objects) - len(jobs)} reused)")
+    for result in results:
+        if result.returncode != 0:
+            return result
+
+    # objects of older builds of these units are stale now
+    current = set(objects)
+    for name in sources:
+        for old in os.listdir(build_dir):
+            old_path = os.path.join(build_dir, old)
+            if old.endswith(".o") and old[:-2].rsplit("-", 1)[0] == name and old_path not in current:
+                os.remove(old_path)
+
+    with phase("g++"):
+        return run_gpp(profile.compile_flags() + objects + ["-o", output] + profile.link_flags())
+
+
+# ---------------------------------------------------------------------------
+#  Precompiled prelude header
+# ---------------------------------------------------------------------------
+
+# precompiled headers kept for other compiler versions / flag sets
+PCH_KEEP = 4
+
+
+def prelude_pch(flags: List[str]) -> Optional[str]:
+    """Path of the prelude header with a matching .gch next to it, built on first use.
+
+    The header lives in cache/pch/<hash of g++ version, flags and prelude>/,
+    so a new compiler or flag set gets its own copy. Pass the returned path
+    to g++ with -include. Returns None if the header cannot be built.
+    """
+    prelude = "\n".join(PRELUDE_CPP) + "\n"
+    key = content_hash("\0".join([gpp_version(), " ".join(flags), prelude]))
+    pch_root = os.path.join(cache_dir(), "pch")
+    directory = os.path.join(pch_root, key[:16])
+    header = os.path.join(directory, PRELUDE_HEADER)
+    gch = header + ".gch"
+    if os.path.exists(gch):
+        os.utime(directory)
+        return header
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        write_if_changed(header, prelude)
+    except OSError:
+        return None
+    tmp = f"{gch}.{uuid.uuid4().hex}.tmp"
+    result = run_gpp(flags + ["-x", "c++-header", header, "-o", tmp])
+    if result.returncode != 0:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        print("[Py++] could not precompile the prelude, compiling it inline")
+        return None
+    os.replace(tmp, gch)
+    print(f"[Py++] precompiled the prelude for {' '.join(flags)}")
+
+    # forget the least recently used headers of old compilers / flag sets
+    prune_dirs(pch_root, PCH_KEEP)
+    return header
+
+
+def prune_dirs(root: str, keep: int):
+    """Delete all but the `keep` most recently used directories in `root`."""
+    others = sorted(
+        (os.path.getmtime(os.path.join(root, name)), name) for name in os.listdir(root)
+    )
+    for _, name in others[:-keep]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+#  Profile-guided optimization
+# ---------------------------------------------------------------------------
+
+# profiles kept for other sources / flag sets
+PGO_KEEP = 8
+
+
+def pgo_flags(
+    cpp: str, cpp_path: str, output: str, flags: List[str], link: List[str], args: List[str]
+) -> Tuple[List[str], str]:
+    """Flags that build `cpp` with its recorded profile, training one first if needed.
+
+    Returns the flags and the C++ file to compile with them. Profiles live
+    in cache/pgo/<hash of the C++, g++ version and flags>/, so they are
+    reused until the generated code changes. Training builds an
+    instrumented binary at `output` and runs the --pgo-run command (in a
+    shell), or the binary itself with --pgo-input as its stdin.
+
+    g++ names the .gcda after the output file and checks the profile of
+    each function against its source file name, both of which differ
+    between builds (another directory, output name or batch build). So the
+    C++ is compiled from a copy in the profile directory, with the .gcda
+    name fixed by -dumpdir and -dumpbase.
+    """
+    key = content_hash("\0".join([gpp_version(), " ".join(flags + link), cpp]))
+    pgo_root = os.path.join(cache_dir(), "pgo")
+    profile_dir = os.path.abspath(os.path.join(pgo_root, key[:16]))
+    source = os.path.join(profile_dir, "pypp.cpp")
+    naming = ["-dumpdir", profile_dir + os.sep, "-dumpbase", "pypp"]
+    use_flags = [f"-fprofile-use={profile_dir}", "-fprofile-correction"] + naming
+
+    if recorded_profile(profile_dir) and os.path.exists(source):
+        os.utime(profile_dir)
+        print("[Py++] reusing the recorded profile")
+        return use_flags, source
+
+    os.makedirs(profile_dir, exist_ok=True)
+    shutil.copyfile(cpp_path, source)
+    generate = [f"-fprofile-generate={profile_dir}"] + naming
+    result = run_gpp(flags + generate + [source, "-o", output] + link)
+    if result.returncode != 0:
+        return [], cpp_path  # the normal build reports the error
+
+    command = option_value(args, "--pgo-run")
+    input_path = option_value(args, "--pgo-input")
+    print("[Py++] training the instrumented build...", flush=True)
+    start = time.perf_counter()
+    if command is not None:
+        training = subprocess.run(command, shell=True)
+    else:
+        with open(input_path, "rb") if input_path else open(os.devnull, "rb") as stdin:
+            training = subprocess.run([os.path.abspath(output)], stdin=stdin)
+    print(f"[Py++] training finished in {time.perf_counter() - start:.2f}s")
+    if training.returncode != 0:
+        print(f"[Py++] warning: the training run exited with {training.returncode}")
+
+    prune_dirs(pgo_root, PGO_KEEP)
+    if not recorded_profile(profile_dir):
+        print("[Py++] warning: the training run wrote no profile; building without one")
+        return [], cpp_path
+    return use_flags, source
+
+
+def recorded_profile(profile_dir: str) -> bool:
+    """Whether a training run left its .gcda below `profile_dir`."""
+    for _, _, filenames in os.walk(profile_dir):
+        if any(name.endswith(".gcda") for name in filenames):
+            return True
+    return False
+
+
+# ---------------------------------------------------------------------------
+#  Output cache: compiled binaries keyed by the generated C++
+# ---------------------------------------------------------------------------
+
+
+class OutputCache:
+    """Compiled outputs (binaries or out.s) keyed by the generated C++, g++ and flags.
+
+    Hit and miss counts are kept in stats.json next to the entries. Entries
+    are evicted least recently used first once the cache grows past `max_bytes`.
+    """
+
+    STATS = "stats.json"
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_env(cls) -> "OutputCache":
+        directory = os.path.join(cache_dir(), "outputs")
+        max_mb = os.environ.get("PYPP_OUTPUT_CACHE_MB")
+        if max_mb:
+            return cls(directory, int(float(max_mb) * 1024 * 1024))
+        return cls(directory)
+
+    def key(self, cpp: str, flags: List[str]) -> str:
+        digest = self.digest(flags)
+        digest.update(cpp.encode("utf-8"))
+        return digest.hexdigest()
+
+    def digest(self, flags: List[str]):
+        """A hash to feed the C++ into; its hexdigest is then the key."""
+        return hashlib.sha256(f"{gpp_version()}\0{' '.join(flags)}\0".encode("utf-8"))
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.directory, self.STATS), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+    def _count(self, field: str) -> Dict[str, int]:
+        stats = self.stats()
+        stats[field] = stats.get(field, 0) + 1
+        tmp = os.path.join(self.directory, f"{self.STATS}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(stats, f)
+            os.replace(tmp, os.path.join(self.directory, self.STATS))
+        except OSError:
+            pass
+        return stats
+
+    def restore(self, key: str, output: str) -> bool:
+        """Copy the cached output for `key` to `output`; False on a miss."""
+        entry_path = self._entry_path(key)
+        try:
+            shutil.copyfile(entry_path, output)
+            shutil.copymode(entry_path, output)
+            os.utime(entry_path)
+        except OSError:
+            self._count("misses")
+            return False
+        stats = self._count("hits")
+        print(f"[Py++] restored {output} from the output cache ({stats['hits']} hits, {stats['misses']} misses)")
+        return True
+
+    def store(self, key: str, output: str):
+        entry_path = self._entry_path(key)
+        tmp = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            shutil.copyfile(output, tmp)
+            shutil.copymode(output, tmp)
+            os.replace(tmp, entry_path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        trim_directory(self.directory, self.max_bytes, keep=(self.STATS,))
+
+
+# ---------------------------------------------------------------------------
+#  Build profiles
+# ---------------------------------------------------------------------------
+
+CONFIG_FILE = "pypp.json"
+
+BUILTIN_PROFILES: Dict[str, Dict] = {
+    "release": {"flags": ["-O3"]},
+    "debug": {"flags": ["-O0", "-g"]},
+    "size": {"flags": ["-Os"], "link": ["-s"]},
+    "native": {"flags": ["-O3", "-march=native"], "lto": True},
+}
+
+
+class BuildProfile:
+    """Compiler and linker settings for one build.
+
+    `modules` maps a module name (the file name without .pypp, or "main")
+    to extra compile flags for that module; they apply to --split builds,
+    where every module is compiled on its own.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flags: Optional[List[str]] = None,
+        lto: bool = False,
+        link: Optional[List[str]] = None,
+        libs: Optional[List[str]] = None,
+        std: str = "c++17",
+        modules: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.name = name
+        self.flags = flags or []
+        self.lto = lto
+        self.link = link or []
+        self.libs = libs or []
+        self.std = std
+        self.modules = modules or {}
+
+    def compile_flags(self, module: Optional[str] = None, lto: bool = True) -> List[str]:
+        flags = [f"-std={self.std}"] + self.flags
+        if self.lto and lto:
+            flags.append("-flto=auto")
+        return flags + self.modules.get(module, [])
+
+    def link_flags(self) -> List[str]:
+        # libraries go last so the linker sees them after the code that needs them
+        return self.link + [f"-l{lib}" for lib in self.libs]
+
+
+def is_str_list(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+# what each field of a profile in pypp.json must be: (check, description)
+PROFILE_FIELDS: Dict[str, Tuple[Callable[[Any], bool], str]] = {
+    "flags": (is_str_list, "a list of strings"),
+    "link": (is_str_list, "a list of strings"),
+    "libs": (is_str_list, "a list of strings"),
+    "lto": (lambda value: isinstance(value, bool), "true or false"),
+    "std": (lambda value: isinstance(value, str), "a string"),
+    "modules": (lambda value: isinstance(value, dict), "an object"),
+}
+
+
+def config_error(config_path: str, problem: str):
+    print(f"[Py++] Error: invalid {config_path}: {problem}")
+    sys.exit(1)
+
+
+def check_config(config: Any, config_path: str):
+    """Exit with an error unless `config` has the shape load_profile expects."""
+    if not isinstance(config, dict):
+        config_error(config_path, "expected an object")
+    if not isinstance(config.get("profile", ""), str):
+        config_error(config_path, '"profile" must be a string')
+    if not isinstance(config.get("profiles", {}), dict):
+        config_error(config_path, '"profiles" must be an object')
+    for name, profile in config.get("profiles", {}).items():
+        if not isinstance(profile, dict):
+            config_error(config_path, f'profile "{name}" must be an object')
+        for field, value in profile.items():
+            if field not in PROFILE_FIELDS:
+                config_error(config_path, f'profile "{name}" has an unknown field "{field}"')
+            check, description = PROFILE_FIELDS[field]
+            if not check(value):
+                config_error(config_path, f'"{field}" of profile "{name}" must be {description}')
+    sources = [config.get("modules", {})]
+    sources += [profile.get("modules", {}) for profile in config.get("profiles", {}).values()]
+    for source in sources:
+        if not isinstance(source, dict):
+            config_error(config_path, '"modules" must be an object')
+        for module, extra in source.items():
+            if not isinstance(extra, dict) or not is_str_list(extra.get("flags", [])):
+                config_error(
+                    config_path, f'module "{module}" must be an object with a list of "flags"'
                 )
-            out_lines.append("    std::exit(1);")
-            out_lines.append("}")
-            continue
-        if s.startswith("assert_fix:"):
-            args = s[11:].split("=>")
-            statement = args[0].strip()
-            fix = args[1].strip()
-            tmp = str(uuid.uuid4()).replace("-", "")
-            out_lines.append(f"bool ___{tmp} = ({statement});")
-            out_lines.append(f"if (!___{tmp}) {{")
-            out_lines.append(f"    {fix};")
-            out_lines.append("}")
-            continue
-        if s.startswith("input(") or s.startswith("numinput("):
-            numeric = s.startswith("numinput")
-            inside = s[s.find("(") + 1 : s.rfind(")")]
-            parts = split_(inside)
-            if len(parts) >= 2:
-                var_name = parts[1]
-                prompt = parts[0]
-                out_lines.append(f"std::cout << {prompt} << std::flush;")
-                if numeric:
-                    out_lines.append(f"std::cin >> {var_name};")
-                    out_lines.append(
-                        "std::cin.ignore(std::numeric_limits<std::streamsize>::max(), '\\n');"
-                    )
-                else:
-                    out_lines.append(f"std::getline(std::cin, {var_name});")
+
+
+def load_profile(target: str, args: List[str]) -> BuildProfile:
+    """Pick the build profile for `target`.
+
+    The name comes from --profile, then -r (debug), then the "profile" key
+    of a pypp.json next to the target, and defaults to release. pypp.json
+    may define new profiles or change built-in ones under "profiles", and
+    add per-module flags under "modules" (at the top level or per profile).
+    """
+    config: Dict = {}
+    config_path = os.path.join(os.path.dirname(os.path.abspath(target)), CONFIG_FILE)
+    if os.path.exists(config_path):
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except ValueError as e:
+            config_error(config_path, str(e))
+        check_config(config, config_path)
+
+    name = option_value(args, "--profile") or ("debug" if "-r" in args else None)
+    name = name or config.get("profile", "release")
+    settings = dict(BUILTIN_PROFILES.get(name, {}))
+    settings.update(config.get("profiles", {}).get(name, {}))
+    if not settings:
+        known = sorted(set(BUILTIN_PROFILES) | set(config.get("profiles", {})))
+        print(f"[Py++] Error: unknown build profile '{name}' (known: {', '.join(known)})")
+        sys.exit(1)
+
+    modules: Dict[str, List[str]] = {}
+    for source in (config.get("modules", {}), settings.pop("modules", {})):
+        for module, extra in source.items():
+            modules.setdefault(module, []).extend(extra.get("flags", []))
+    return BuildProfile(name, modules=modules, **settings)
+
+
+# ---------------------------------------------------------------------------
+#  Phase statistics: where a build's time and memory go (--time-phases)
+# ---------------------------------------------------------------------------
+
+
+class PhaseStats:
+    """Wall time, peak memory and call counts per build phase.
+
+    Phases nest, and each is charged only its own time, so together they add
+    up to the build. For phases that run g++, peak memory is the peak
+    resident size of those processes, if it beat all earlier ones: the OS
+    only keeps the maximum over all children. With `trace_memory` the other
+    phases get the Python heap's high-water mark (from tracemalloc) while
+    they ran, but tracing slows them down severalfold, so their times are
+    only comparable with other traced runs.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self.modules: Dict[str, Dict[str, Any]] = {}
+        self.lines: Dict[str, int] = {}
+        self.flags: List[str] = []
+        self._open: List[List[float]] = []  # [start, seconds in nested phases, own peak, children's peak]
+
+    def _heap_peak(self) -> int:
+        return tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+
+    def _reset_peak(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def measure(self, name: str, module: Optional[str] = None):
+        if self._open:
+            self._open[-1][2] = max(self._open[-1][2], self._heap_peak())
+        self._reset_peak()
+        frame = [time.perf_counter(), 0.0, 0, child_peak_rss() if name in CHILD_PHASES else 0]
+        self._open.append(frame)
+        try:
+            yield
+        finally:
+            self._open.pop()
+            elapsed = time.perf_counter() - frame[0]
+            own = elapsed - frame[1]
+            peak = max(frame[2], self._heap_peak())
+            if name in CHILD_PHASES and child_peak_rss() > frame[3]:
+                peak = max(peak, child_peak_rss())
+            entry = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_bytes": 0})
+            entry["seconds"] += own
+            entry["calls"] += 1
+            entry["peak_bytes"] = max(entry["peak_bytes"], peak)
+            if module:
+                self.note_module(module)
+                self.modules[module]["seconds"] += own
+            if self._open:
+                self._open[-1][1] += elapsed
+            self._reset_peak()
+
+    def note_module(self, module: str, **fields):
+        entry = self.modules.setdefault(module, {"seconds": 0.0, "lines": 0, "cached": False})
+        entry.update(fields)
+
+    def to_json(self, target: str, ok: bool) -> Dict[str, Any]:
+        return {
+            "target": os.path.abspath(target),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "ok": ok,
+            "seconds": time.perf_counter() - self.started,
+            "gpp": (gpp_version().splitlines() or [""])[0],
+            "flags": self.flags,
+            "memory_traced": self.trace_memory,
+            "phases": self.phases,
+            "modules": self.modules,
+            "lines": self.lines,
+        }
+
+    def _peak_text(self, name: str, entry: Dict[str, Any]) -> str:
+        if not self.trace_memory and name not in CHILD_PHASES:
+            return " " * 16  # not measured
+        return f"{entry['peak_bytes'] / 2**20:8.1f} MB peak"
+
+    def report(self, target: str):
+        total = time.perf_counter() - self.started
+        traced = " (memory traced, so Python phases run slower)" if self.trace_memory else ""
+        print(f"\n[Py++] phases of {target}{traced}:")
+        for name, entry in sorted(self.phases.items(), key=lambda item: -item[1]["seconds"]):
+            print(
+                f"  {name:<20}{entry['seconds']:9.3f}s {100 * entry['seconds'] / total:5.1f}%"
+                f"  {self._peak_text(name, entry)}  ({entry['calls']} calls)"
+            )
+        other = total - sum(entry["seconds"] for entry in self.phases.values())
+        print(f"  {'other':<20}{other:9.3f}s {100 * other / total:5.1f}%")
+        print(f"  {'total':<20}{total:9.3f}s")
+        print("  modules:")
+        for module, entry in sorted(self.modules.items(), key=lambda item: -item[1]["seconds"]):
+            cached = "  (cached)" if entry["cached"] else ""
+            print(f"    {module:<28}{entry['seconds']:9.3f}s {entry['lines']:7} lines{cached}")
+        print("  lines: " + ", ".join(f"{count} {kind}" for kind, count in self.lines.items()))
+
+
+PHASE_STATS: Optional[PhaseStats] = None  # set while build() times a build
+CHILD_PHASES = {"g++", "pch", "pgo", "transpile+g++"}  # phases that run g++ or the program
+
+
+def phase(name: str, module: Optional[str] = None):
+    """Charge the enclosed work to `name` when the current build is timed."""
+    return PHASE_STATS.measure(name, module) if PHASE_STATS else nullcontext()
+
+
+def child_peak_rss() -> int:
+    """Largest resident size of a finished child process, in bytes (0 if unknown)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# ---------------------------------------------------------------------------
+#  Building targets
+# ---------------------------------------------------------------------------
+
+
+# programs that start threads need -pthread when compiling and linking
+THREAD_PATTERN = re.compile(r"#include\s*<(?:thread|mutex|condition_variable|future)>")
+
+
+def build(
+    target: str,
+    args: List[str],
+    cpp_path: str = "out.cpp",
+    build_dir: str = BUILD_DIR,
+    asm_path: str = "out.s",
+    module_cache: Optional[ModuleCache] = None,
+    deps: Optional[Dict[str, str]] = None,
+) -> bool:
+    """Transpile and compile one .pypp file; `args` are the command line options.
+
+    Files the program was built from are added to `deps`, if given. With
+    --time-phases the time and memory of each phase are reported, and with
+    --phases-json <file> they are appended to `file` as a line of JSON.
+    --trace-memory adds the Python heap to the memory figures, at the cost
+    of slower (and separately labelled) Python phases.
+    """
+    global PHASE_STATS
+    json_path = option_value(args, "--phases-json")
+    if "--time-phases" not in args and json_path is None:
+        return build_target(target, args, cpp_path, build_dir, asm_path, module_cache, deps)
+
+    PHASE_STATS = stats = PhaseStats(trace_memory="--trace-memory" in args)
+    if stats.trace_memory:
+        tracemalloc.start()
+    ok = False
+    try:
+        ok = build_target(target, args, cpp_path, build_dir, asm_path, module_cache, deps)
+    finally:
+        PHASE_STATS = None
+        if stats.trace_memory:
+            tracemalloc.stop()
+        if "--time-phases" in args:
+            stats.report(target)
+        if json_path is not None:
+            with open(json_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(stats.to_json(target, ok)) + "\n")
+    return ok
+
+
+def build_target(
+    target: str,
+    args: List[str],
+    cpp_path: str,
+    build_dir: str,
+    asm_path: str,
+    module_cache: Optional[ModuleCache],
+    deps: Optional[Dict[str, str]],
+) -> bool:
+    if module_cache is None and "--no-cache" not in args:
+        module_cache = ModuleCache.from_env()
+
+    # every file is macro-expanded exactly once while loading
+    src = load_with_imports_renamed(
+        target,
+        apply_macros_everywhere="-d" in args,
+        cache=module_cache,
+        deps=deps,
+        index=ModuleIndex.from_args(args),
+    )
+    if module_cache is not None:
+        module_cache.trim()
+    if "--shake" in args:
+        with phase("shake"):
+            src = tree_shake(src, option_values(args, "--keep"))
+
+    output = f"{target[:-5]}.exe" if os.name == "nt" else target[:-5]
+    profile = load_profile(target, args)
+    if "--fast-io" in args:
+        profile.flags.append("-DPYPP_FAST_IO")
+    if "--instrument" in args:
+        profile.flags.append("-DPYPP_INSTRUMENT")
+        builtin = set().union(*(builtin_module_ids(root) for root in module_search_path(args)))
+        src = instrument_functions(src, builtin)
+    if THREAD_PATTERN.search(src) and "-pthread" not in profile.flags:
+        profile.flags.append("-pthread")
+    flags = profile.compile_flags()
+    link = profile.link_flags()
+    if PHASE_STATS:
+        PHASE_STATS.flags = flags + link
+        PHASE_STATS.lines["loaded"] = src.count("\n") + 1
+
+    def pch_flags(flags: List[str]) -> List[str]:
+        # profile flags would make every precompiled header unique
+        if "--no-pch" in args or "--pgo" in args:
+            return []
+        with phase("pch"):
+            header = prelude_pch(flags)
+        return ["-include", header] if header else []
+
+    result = None
+    generated = cpp_path
+    if "--split" in args and "--dump-asm" not in args and "--pgo" not in args:
+        result = build_split(src, output, profile, pch_flags, build_dir)
+        generated = build_dir
+        if result is None:
+            print("[Py++] building a single translation unit instead")
+
+    if result is None and "--pipe" in args and "--dump-asm" not in args and "--pgo" not in args:
+        # transpiling and compiling overlap, so they are timed as one phase
+        generated = None
+        with phase("transpile+g++"):
+            gpp_args = flags + pch_flags(flags) + ["-o", output] + link
+            result, count = pipe_to_gpp(gpp_args, stream_cpp(src))
+        if PHASE_STATS:
+            PHASE_STATS.lines["generated"] = count
+
+    if result is None:
+        generated = cpp_path
+        if "--dump-asm" in args:
+            # LTO would leave GIMPLE instead of assembly in out.s
+            flags = ["-S"] + profile.compile_flags(lto=False)
+            link = []
+            output = asm_path
+
+        # the precompiled prelude follows from g++ and the flags, so it stays out of the key
+        output_cache = None if "--no-cache" in args else OutputCache.from_env()
+        source = cpp_path  # --pgo compiles a copy kept with the profile
+        if "--stream" in args and "--pgo" not in args:
+            # written as it is transpiled, and hashed on the way for the output cache
+            digest = output_cache.digest(flags + link) if output_cache else None
+            with phase("transpile"), open(cpp_path, "w", encoding="utf-8") as f:
+                count = write_lines(stream_cpp(src), f, digest)
+            output_key = digest.hexdigest() if digest else None
+        else:
+            with phase("transpile"):
+                out_cpp = transpile_paren_blocks_to_cpp(src)
+            count = out_cpp.count("\n") + 1
+            with open(cpp_path, "w", encoding="utf-8") as f:
+                f.write(out_cpp)
+            if "--pgo" in args:
+                with phase("pgo"):
+                    extra, source = pgo_flags(out_cpp, cpp_path, output, flags, link, args)
+                    flags = flags + extra
+            with phase("output cache"):
+                output_key = output_cache.key(out_cpp, flags + link) if output_cache else None
+        if PHASE_STATS:
+            PHASE_STATS.lines["generated"] = count
+
+        with phase("output cache"):
+            restored = output_cache is not None and output_cache.restore(output_key, output)
+        if restored:
+            result = subprocess.CompletedProcess([], 0, "", "")
+        else:
+            pch = pch_flags([f for f in flags if f != "-S"])
+            with phase("g++"):
+                result = run_gpp(flags + pch + [source, "-o", output] + link)
+            if output_cache and result.returncode == 0:
+                output_cache.store(output_key, output)
+
+    if result.returncode != 0:
+        print("X Compilation failed:\n")
+        print(result.stderr)
+        if generated:
+            print(f"{generated} preserved for debugging")
+        else:
+            print("build without --pipe to keep the C++ for debugging")
+        return False
+
+    print("V Compilation successful!")
+    if "-p" not in args and generated == cpp_path:
+        os.remove(cpp_path)
+    return True
+
+
+# options followed by a value, which is not a target
+VALUE_OPTIONS = {
+    "--setup",
+    "--pgo-run",
+    "--pgo-input",
+    "--profile",
+    "--phases-json",
+    "--module-path",
+    "--keep",
+}
+
+
+def option_value(args: List[str], name: str) -> Optional[str]:
+    if name in args:
+        i = args.index(name)
+        if i + 1 < len(args):
+            return args[i + 1]
+    return None
+
+
+def option_values(args: List[str], name: str) -> List[str]:
+    """Every value of an option that may be given more than once."""
+    return [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == name]
+
+
+MAIN_PATTERN = re.compile(r"^\s*fn\s+main\s*\(", re.MULTILINE)
+
+
+def file_stamps(paths) -> Dict[str, Optional[Tuple[int, int]]]:
+    stamps = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamps[path] = None
+    return stamps
+
+
+def watch(target: str, args: List[str]):
+    """Rebuild `target` whenever it or one of its imports changes, until Ctrl+C.
+
+    Imported modules stay in memory between builds, so only changed files
+    are preprocessed and renamed again; g++ work is saved by the output
+    cache, or per module with --split.
+    """
+    module_cache = ModuleCache(None) if "--no-cache" in args else ModuleCache.from_env()
+    interval = float(os.environ.get("PYPP_WATCH_INTERVAL", "0.5"))
+    try:
+        while True:
+            deps: Dict[str, str] = {}
+            start = time.perf_counter()
+            try:
+                build(target, args, module_cache=module_cache, deps=deps)
+            except SystemExit:  # missing files and modules exit the loader
+                pass
+            watched = sorted(deps) or [os.path.abspath(target)]
+            print(
+                f"[Py++] built in {time.perf_counter() - start:.2f}s,"
+                f" watching {len(watched)} files (Ctrl+C to stop)"
+            )
+
+            stamps = file_stamps(watched)
+            while file_stamps(watched) == stamps:
+                time.sleep(interval)
+            print()
+    except KeyboardInterrupt:
+        pass
+
+
+def find_targets(args: List[str]) -> List[str]:
+    """Expand the file, directory and glob arguments into .pypp files to build.
+
+    A directory contributes every .pypp file directly inside it that has a
+    main function; the others are taken to be modules.
+    """
+    targets = []
+    for i, arg in enumerate(args):
+        if arg.startswith("-") or (i > 0 and args[i - 1] in VALUE_OPTIONS):
             continue
+        if os.path.isdir(arg):
+            for name in sorted(os.listdir(arg)):
+                path = os.path.join(arg, name)
+                if name.endswith(".pypp") and os.path.isfile(path):
+                    with open(path, "r", encoding="utf-8") as f:
+                        if MAIN_PATTERN.search(f.read()):
+                            targets.append(path)
+        elif glob.has_magic(arg):
+            targets.extend(sorted(glob.glob(arg)))
+        else:
+            targets.append(arg)
+    return list(dict.fromkeys(targets))
 
-        if not s.endswith((";", "{", "}", ">", ",")) and not s.startswith("#"):
-            s += ";"
-        out_lines.append(s)
 
-    while len(block_stack) > 1:
-        out_lines.append("}")
-        print(f"WARNING: closing unclosed {block_stack.pop().kind} block")
+def build_isolated(target: str, args: List[str]) -> Tuple[str, bool, float, str]:
+    """Build `target` in its own temporary directory, capturing its output.
 
-    return "\n".join(out_lines)
+    Returns (target, success, seconds, log). The directory is kept for
+    failed builds (the log names it) and with -p.
+    """
+    work_dir = tempfile.mkdtemp(prefix="pypp-")
+    log = io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(log):
+        try:
+            ok = build(
+                target,
+                args,
+                cpp_path=os.path.join(work_dir, "out.cpp"),
+                build_dir=os.path.join(BUILD_DIR, module_id(target)),
+                asm_path=f"{os.path.splitext(target)[0]}.s",
+            )
+        except SystemExit:  # missing files and modules exit the loader
+            ok = False
+    took = time.perf_counter() - start
+    if (ok and "-p" not in args) or not os.listdir(work_dir):
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return target, ok, took, log.getvalue()
+
+
+def imports_note(log: str) -> str:
+    """How many of the imports in a build log came from the module cache."""
+    imported = [line for line in log.splitlines() if line.startswith("Imported ")]
+    if not imported:
+        return ""
+    cached = sum(line.endswith("(cached)") for line in imported)
+    return f", {cached} of {len(imported)} imports cached"
+
+
+def build_batch(targets: List[str], args: List[str]) -> bool:
+    """Build several targets concurrently, one process each.
+
+    Targets share imported modules through the on-disk module cache: a
+    module processed by one target is reused by the targets that start
+    after it was stored (targets running at the same time may both process
+    it). The status line of each target says how many imports were cached.
+    """
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=min(len(targets), os.cpu_count() or 1)) as pool:
+        jobs = [pool.submit(build_isolated, target, args) for target in targets]
+        for job in jobs:
+            target, ok, took, log = job.result()
+            if ok:
+                print(f"V {target} ({took:.2f}s{imports_note(log)})")
+                if "--time-phases" in args:
+                    for line in log.splitlines():
+                        print(f"    {line}")
+            else:
+                failed += 1
+                print(f"X {target} ({took:.2f}s)")
+                for line in log.splitlines():
+                    print(f"    {line}")
+    print(
+        f"\n{len(targets) - failed} of {len(targets)} targets built"
+        f" in {time.perf_counter() - start:.2f}s"
+    )
+    return failed == 0
 
 
 # ---------------------------------------------------------------------------
@@ -794,6 +3855,8 @@ end
 # ---------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # batch builds start worker processes
+
     if len(sys.argv) < 2:
         print("Usage: py++ <file>")
         sys.exit(1)
@@ -810,41 +3873,18 @@ if __name__ == "__main__":
         print("please install the g++ compiler")
         sys.exit(1)
 
-    src = preprocess_defines(load_with_imports_renamed(sys.argv[1], apply_macros_everywhere="-d" in sys.argv))
-
-    # Process vector comprehensions during transpilation by modifying the transpile_paren_blocks_to_cpp function approach
-    # Since we already modified the function to handle vector comprehensions, now we just need to call it
-    out_cpp = transpile_paren_blocks_to_cpp(src)
-    with open("out.cpp", "w", encoding="utf-8") as f:
-        f.write(out_cpp)
-
-    if "--dump-asm" not in sys.argv:
-        result = subprocess.run(
-            [
-                "g++",
-                "-std=c++17",
-                "-O3" if "-r" not in sys.argv else "-O0",
-                "out.cpp",
-                "-o",
-                f"{sys.argv[1][:-5]}.exe" if os.name == "nt" else sys.argv[1][:-5],
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-    else:
-        result = subprocess.run(
-            ["g++", "-S", "-std=c++17", "-O3", "out.cpp", "-o", "out.s"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
+    args = sys.argv[1:]
+    targets = find_targets(args)
+    if not targets:
+        print("Usage: py++ <file>")
+        sys.exit(1)
 
-    if result.returncode != 0:
-        print("X Compilation failed:\n")
-        print(result.stderr)
-        print("out.cpp preserved for debugging")
+    if "--watch" in args:
+        if len(targets) != 1:
+            print("Usage: py++ --watch <file>")
+            sys.exit(1)
+        watch(targets[0], args)
+    elif len(targets) == 1 and targets[0] in args:
+        build(targets[0], args)
     else:
-        print("V Compilation successful!")
-        if "-p" not in sys.argv:
-            os.remove("out.cpp")
+        sys.exit(0 if build_batch(targets, args) else 1)
@@ -0,0 +1,60 @@
+import importlib.util
+import os
+import shutil
+import subprocess
+
+import pytest
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "py++.py")
+
+
+@pytest.fixture(scope="session")
+def pypp():
+    """py++.py imported as a module (its file name is not a valid identifier)."""
+    spec = importlib.util.spec_from_file_location("pypp", PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def modules(pypp, tmp_path_factory):
+    """A search directory holding the built-in modules, as --setup installs them."""
+    root = tmp_path_factory.mktemp("install") / "modules"
+    for rel, content in pypp.BUILTIN_MODULES.items():
+        path = root.parent / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    return str(root)
+
+
+@pytest.fixture
+def transpile(pypp, modules, tmp_path, capsys):
+    """Load and transpile a main file importing built-in modules; returns the C++."""
+
+    def run(source: str) -> str:
+        main = tmp_path / "main.pypp"
+        main.write_text(source, encoding="utf-8")
+        index = pypp.ModuleIndex([modules])
+        src = pypp.load_with_imports_renamed(str(main), index=index)
+        capsys.readouterr()  # the loader's progress lines
+        return pypp.transpile_paren_blocks_to_cpp(src)
+
+    return run
+
+
+@pytest.fixture
+def syntax_errors(tmp_path):
+    """g++'s complaints about some C++, or "" if it compiles (or g++ is missing)."""
+
+    def check(cpp: str) -> str:
+        if shutil.which("g++") is None:
+            return ""
+        path = tmp_path / "out.cpp"
+        path.write_text(cpp, encoding="utf-8")
+        result = subprocess.run(
+            ["g++", "-std=c++17", "-fsyntax-only", str(path)], capture_output=True, text=True
+        )
+        return result.stderr if result.returncode else ""
+
+    return check
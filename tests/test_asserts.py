@@ -0,0 +1,67 @@
+"""Temporaries of assert: and assert_fix: must not collide within one output file."""
+
+import importlib.util
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "py++.py")
+spec = importlib.util.spec_from_file_location("pypp", PATH)
+pypp = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(pypp)
+
+MAIN = """fn main() int
+    int x = 3
+    assert: x > 0 @@@ "pos"
+    assert: x > 0 @@@ "pos"
+    assert_fix: x > 0 => x = 1
+    assert_fix: x > 0 => x = 1
+    if x > 1
+        assert: x > 0 @@@ "pos" § assert: x > 0 @@@ "pos"
+    end
+    return 0
+end
+"""
+TEMP = re.compile(r"bool (___\w+) =")
+
+
+def temps(cpp: str) -> list:
+    return TEMP.findall(cpp)
+
+
+def assert_unique(cpp: str) -> None:
+    names = temps(cpp)
+    assert len(names) == 6
+    assert len(set(names)) == len(names)
+
+
+def test_whole_file():
+    assert_unique(pypp.transpile_paren_blocks_to_cpp(MAIN))
+
+
+def test_stream_matches_whole_file():
+    streamed = "\n".join(pypp.stream_cpp(MAIN))
+    assert_unique(streamed)
+    assert streamed == pypp.transpile_paren_blocks_to_cpp(MAIN)
+
+
+def test_deterministic():
+    assert pypp.transpile_paren_blocks_to_cpp(MAIN) == pypp.transpile_paren_blocks_to_cpp(MAIN)
+
+
+def test_split_unit():
+    header, source = pypp._unit_cpp("main", (), MAIN)
+    assert_unique(header + "\n" + source)
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="g++ not found")
+def test_compiles(tmp_path):
+    cpp = tmp_path / "out.cpp"
+    cpp.write_text(pypp.transpile_paren_blocks_to_cpp(MAIN), encoding="utf-8")
+    result = subprocess.run(
+        ["g++", "-std=c++17", "-fsyntax-only", str(cpp)], capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,9 @@
+"""Each block construct ends with the closing text its C++ needs."""
+
+
+def test_cls_ends_with_semicolon(pypp, syntax_errors):
+    cpp = pypp.transpile_paren_blocks_to_cpp(
+        "cls Point\n    public:\n    int x = 0\nend\n\nfn main() int\n    Point p\n    return p.x\nend\n"
+    )
+    assert "class Point {" in cpp
+    assert syntax_errors(cpp) == ""
@@ -0,0 +1,18 @@
+"""Each define only rewrites what the defines before it produced, as in one pass per define."""
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "src, expected",
+    [
+        ("define N 10\ndefine M N\nx = M + N", "x = N + 10"),
+        ("define M N\ndefine N 10\nx = M + N", "x = 10 + 10"),
+        ("define A F\ndefine F(x) x*2\ny = F(A) + A", "y = F*2 + F"),
+        ("define F(x) x*2\ndefine A F(3)\ny = A", "y = F(3)"),
+        ("define X X+1\nX", "X+1"),
+        ("define S strvec\nS v", "std::vector<std::string> v"),
+    ],
+)
+def test_definition_order(pypp, src, expected):
+    assert pypp.preprocess_defines(src) == expected
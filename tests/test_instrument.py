@@ -0,0 +1,25 @@
+"""--instrument times the program's functions, not the built-in helpers it calls."""
+
+MODULE = """fn area(int w, int h) int
+    return w * h
+end
+"""
+
+MAIN = """imp std/bench.pypp
+imp shapes.pypp
+
+fn main() int
+    print(shapes.area(2, 3))
+    return 0
+end
+"""
+
+
+def test_builtin_modules_are_not_instrumented(pypp, modules, tmp_path, capsys):
+    (tmp_path / "shapes.pypp").write_text(MODULE, encoding="utf-8")
+    (tmp_path / "main.pypp").write_text(MAIN, encoding="utf-8")
+    src = pypp.load_with_imports_renamed(str(tmp_path / "main.pypp"), index=pypp.ModuleIndex([modules]))
+    capsys.readouterr()
+    instrumented = pypp.instrument_functions(src, pypp.builtin_module_ids(modules))
+    sites = [line for line in instrumented.splitlines() if "__pypp_site(" in line]
+    assert sites == [pypp.INSTRUMENT_SCOPE.format(name=name) for name in ("shapes.area", "main")]
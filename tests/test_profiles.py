@@ -0,0 +1,50 @@
+"""pypp.json is checked before it is used; mistakes are reported, not raised."""
+
+import json
+
+import pytest
+
+BAD = {
+    "flags a string": ({"profiles": {"fast": {"flags": "-O2"}}}, '"flags" of profile "fast"'),
+    "link a string": ({"profiles": {"fast": {"link": "-pthread"}}}, '"link" of profile "fast"'),
+    "libs of numbers": ({"profiles": {"fast": {"libs": [1]}}}, '"libs" of profile "fast"'),
+    "lto a string": ({"profiles": {"fast": {"lto": "yes"}}}, '"lto" of profile "fast"'),
+    "std a number": ({"profiles": {"fast": {"std": 17}}}, '"std" of profile "fast"'),
+    "profile a list": ({"profiles": {"fast": ["-O2"]}}, 'profile "fast" must be an object'),
+    "unknown field": ({"profiles": {"fast": {"flag": []}}}, 'unknown field "flag"'),
+    "profiles a list": ({"profiles": []}, '"profiles" must be an object'),
+    "modules a list": ({"modules": ["random"]}, '"modules" must be an object'),
+    "module flags a string": ({"modules": {"random": {"flags": "-O3"}}}, 'module "random"'),
+    "profile modules": ({"profiles": {"fast": {"modules": {"m": []}}}}, 'module "m"'),
+    "not an object": ([1], "expected an object"),
+}
+
+
+def load(pypp, tmp_path, config, args=()):
+    (tmp_path / "pypp.json").write_text(json.dumps(config), encoding="utf-8")
+    return pypp.load_profile(str(tmp_path / "main.pypp"), list(args))
+
+
+@pytest.mark.parametrize("case", sorted(BAD))
+def test_bad_config(pypp, tmp_path, capsys, case):
+    config, problem = BAD[case]
+    with pytest.raises(SystemExit) as exit_info:
+        load(pypp, tmp_path, config, ["--profile", "fast"])
+    assert exit_info.value.code == 1
+    out = capsys.readouterr().out
+    assert out.startswith("[Py++] Error: invalid ") and "pypp.json" in out
+    assert problem in out
+
+
+def test_good_config(pypp, tmp_path):
+    config = {
+        "profiles": {
+            "fast": {"flags": ["-O2"], "link": ["-pthread"], "libs": ["m"], "lto": True,
+                     "std": "c++20", "modules": {"random": {"flags": ["-O3"]}}},
+        },
+        "modules": {"strOps": {"flags": ["-Os"]}},
+    }
+    profile = load(pypp, tmp_path, config, ["--profile", "fast"])
+    assert profile.compile_flags("random") == ["-std=c++20", "-O2", "-flto=auto", "-O3"]
+    assert profile.compile_flags("strOps") == ["-std=c++20", "-O2", "-flto=auto", "-Os"]
+    assert profile.link_flags() == ["-pthread", "-lm"]
@@ -0,0 +1,46 @@
+"""Range literals must still expand after the built-in modules are imported."""
+
+import pytest
+
+PROGRAM = """imp {module}
+
+fn main() int
+    vec<int> v = 1..5
+    foreach x 0..3
+        v.push_back(x)
+    end
+    return v.size() == 9 ? 0 : 1
+end
+"""
+
+
+@pytest.mark.parametrize("module", ["std", "std/fileOps.pypp", "std/parallel.pypp"])
+def test_range_after_import(transpile, syntax_errors, module):
+    cpp = transpile(PROGRAM.format(module=module))
+    assert "1..5" not in cpp
+    assert syntax_errors(cpp) == ""
+
+
+def test_stray_quote_only_affects_its_line(pypp):
+    src = "%> don't\nint a = 0 // it's\nvec<int> v = 1..3\nchar c = 'x'\nstd::string s = \"1..2\"\n"
+    out = pypp.expand_ranges_outside_strings(src)
+    assert "vec<int> v = __pypp_range(1, 3, 1)" in out
+    assert "%> don't\nint a = 0 // it's\n" in out
+    assert '"1..2"' in out and "'x'" in out
+
+
+def test_stream_holds_back_nothing(pypp):
+    lines = ["%> it's", "char c = '"] + [f"vec<int> v{i} = 1..{i % 7}" for i in range(5000)]
+    pulled = 0
+
+    def source():
+        nonlocal pulled
+        for line in lines:
+            pulled += 1
+            yield line
+
+    stream = pypp.expand_ranges_lines(source())
+    next(stream)
+    assert pulled <= pypp.RANGE_BATCH
+    streamed = [next(stream)] + list(stream)
+    assert ["%> it's"] + streamed == pypp.expand_ranges_outside_strings("\n".join(lines)).split("\n")
@@ -0,0 +1,33 @@
+"""--shake drops what the program cannot reach, and nothing that runs on its own."""
+
+MODULE = """fn announce() int
+    print("loaded\\n")
+    return 1
+end
+
+fn unused() int
+    return 2
+end
+
+int announced = announce()
+int spare = 3 * 4
+"""
+
+MAIN = """imp noisy.pypp
+
+fn main() int
+    return 0
+end
+"""
+
+
+def test_global_with_side_effects_is_kept(pypp, tmp_path, capsys):
+    (tmp_path / "noisy.pypp").write_text(MODULE, encoding="utf-8")
+    (tmp_path / "main.pypp").write_text(MAIN, encoding="utf-8")
+    src = pypp.load_with_imports_renamed(str(tmp_path / "main.pypp"), index=pypp.ModuleIndex([]))
+    shaken = pypp.tree_shake(src)
+    capsys.readouterr()
+    assert "int noisy_announced = noisy_announce()" in shaken
+    assert "fn noisy_announce()" in shaken
+    assert "noisy_unused" not in shaken
+    assert "noisy_spare" not in shaken
@@ -0,0 +1,25 @@
+"""--split builds: every unit sees the prelude, helpers included."""
+
+import shutil
+import subprocess
+
+import pytest
+
+pytestmark = pytest.mark.skipif(shutil.which("g++") is None, reason="g++ not found")
+
+
+def test_module_calls_prelude_helper(pypp, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PYPP_CACHE", str(tmp_path / "cache"))
+    (tmp_path / "nums.pypp").write_text(
+        "fn parse(std::string s) int\n    return sstoi(s) + 1\nend\n", encoding="utf-8"
+    )
+    (tmp_path / "main.pypp").write_text(
+        'imp nums.pypp\n\nfn main() int\n    return nums_parse("41") + sstoi("x") == 41 ? 0 : 1\nend\n',
+        encoding="utf-8",
+    )
+    ok = pypp.build("main.pypp", ["--split", "--no-pch"], build_dir=str(tmp_path / "build"))
+    out = capsys.readouterr().out
+    assert ok, out
+    assert "compiled 2 of 2 units" in out
+    assert subprocess.run([str(tmp_path / "main")]).returncode == 0